@@ -2,26 +2,385 @@
 # -*- coding: utf-8 -*-
 
 import os
+import sys
 import unicodedata
 import re
-# from xml.sax.saxutils import escape as xml_escape
+from xml.sax.saxutils import escape as xml_escape
+import xml.etree.cElementTree as ElementTree
 import itertools
 import csv
 import argparse
+import multiprocessing
+import multiprocessing.pool
+import contextlib
+import threading
+import time
+import hashlib
+import marshal
+import gc
+import sqlite3
+import json
+import io
+import codecs
+import mmap
+
+PY3 = sys.version_info[0] >= 3
+
+if PY3:
+    # text is str, decoded when files are read and encoded when they are written
+    (izip, imap, xrange, raw_input, intern) = (zip, map, range, input, sys.intern)
+    buffer = lambda data, offset: memoryview(data)[offset:]
+    # the regex flag restricting \w and \s to ascii, as they are for the Python 2 byte strings
+    asciiflag = re.ASCII
+else:
+    # text is str too, i-e utf-8 encoded bytes, utf-8 files being read and written as is
+    from itertools import izip, imap
+    asciiflag = 0
 
 
 global __showwarnings, __showinfo
 
+# True while the logs are silenced, see quietlogs
+__quiet = False
+
 def loginfo(str):
     """Utility function to log information"""
-    if __showinfo:
+    if __showinfo and not __quiet:
         print(str)
 
 def logwarning(str):
     """Utility function to log warnings"""
+    if __quiet:
+        return
+    if profiler:
+        profiler.warning(str)
     if __showwarnings:
         print('Warning: '+str)
 
+def logerror(str):
+    """Utility function to log errors, shown even when the warnings are not"""
+    if not __quiet:
+        print(str)
+
+@contextlib.contextmanager
+def quietlogs():
+    """Silences the logs in a with statement, e.g while feeding again files whose logs were already shown"""
+    global __quiet
+    (quiet, __quiet) = (__quiet, True)
+    try:
+        yield
+    finally:
+        __quiet = quiet
+
+# Profiling
+
+class Profiler:
+    """Collects the timings and counts of a run, once set with setprofiler.
+    Phases can be nested, e.g the parse phase is part of the feed phase.
+    Files are recorded with their phase and the statistics that are known,
+    e.g for a parsed .strings file:
+      bytes, lines, matches (parsed elements), conflicts, fallbacks (ignored lines),
+      parse_seconds (the time spent waiting for the parsed file, its parse time 
+      when parsed serially), merge_seconds"""
+
+    def __init__(self):
+        self.start = time.time()
+        # name -> [seconds, count]
+        self.phases = {}
+        self.files = []
+        self.warnings = []
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Context manager timing a phase"""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.addtime(name, time.time() - start)
+
+    def addtime(self, name, seconds):
+        """Adds the duration of a phase"""
+        p = self.phases.get(name)
+        if p is None:
+            p = self.phases[name] = [0., 0]
+        p[0] += seconds
+        p[1] += 1
+
+    def addfile(self, path, phase, **stats):
+        """Records the statistics of a file"""
+        stats['path'] = path
+        stats['phase'] = phase
+        self.files.append(stats)
+
+    def warning(self, message):
+        """Records a warning"""
+        self.warnings.append(message)
+
+    @classmethod
+    def peakmemory(cls):
+        """Returns the peak resident memory of the process in MB, or None if unknown"""
+        try:
+            import resource
+        except ImportError:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == 'darwin':  # bytes instead of KB
+            peak //= 1024
+        return peak / 1024.
+
+    def report(self):
+        """Returns the collected data as a dictionary"""
+        return { 'seconds' : time.time() - self.start,
+                 'phases' : { name : { 'seconds' : p[0], 'count' : p[1] } for (name, p) in self.phases.items() },
+                 'files' : self.files,
+                 'warnings' : self.warnings,
+                 'peak_memory_mb' : self.peakmemory() }
+
+    def write(self, f):
+        """Writes the report as JSON to a file object"""
+        json.dump(self.report(), f, indent=2, sort_keys=True)
+        f.write('\n')
+
+class NullPhase:
+    """Context manager doing nothing, used for phases when no profiler is set"""
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, type, value, traceback):
+        return False
+
+nullphase = NullPhase()
+
+# the Profiler collecting data, None when not profiling
+profiler = None
+
+def setprofiler(p):
+    """Sets the Profiler collecting data, None to stop profiling.
+    Returns the previous one."""
+    global profiler
+    previous = profiler
+    profiler = p
+    return previous
+
+def profilephase(name):
+    """Returns a context manager timing a phase if a profiler is set"""
+    if profiler:
+        return profiler.phase(name)
+    return nullphase
+
+# Text files
+
+# the byte order marks identifying the encoding of a text file, utf-8 being assumed without one
+byteordermarks = ((codecs.BOM_UTF8, 'utf-8-sig'), 
+                  (codecs.BOM_UTF16_LE, 'utf-16'), 
+                  (codecs.BOM_UTF16_BE, 'utf-16'))
+
+def detectencoding(start):
+    """Returns the encoding of a text from its first bytes: the one of its byte order mark,
+    utf-16 if they contain null bytes, which utf-8 text does not (e.g the files exported without 
+    byte order mark), utf-8 otherwise"""
+    for (bom, encoding) in byteordermarks:
+        if start.startswith(bom):
+            return encoding
+    if b'\0' in start:
+        # the null bytes are mostly the high bytes of ascii characters
+        if start[1::2].count(b'\0') >= start[0::2].count(b'\0'):
+            return 'utf-16-le'
+        return 'utf-16-be'
+    return 'utf-8'
+
+def sniffencoding(path):
+    """Returns the encoding of a text file, see detectencoding"""
+    with open(path, 'rb') as f:
+        return detectencoding(f.read(64))
+
+@contextlib.contextmanager
+def opentext(path, encoding=None, newline='\n'):
+    """Context manager opening a text file for reading, yielding an iterable over its lines as str.
+    In Python 2 the lines are utf-8 encoded, and only the utf-16 files are decoded.
+
+    Keyword arguments:
+    path     -- the file path
+    encoding -- the encoding of the file. Defaults to None, i-e found by sniffencoding
+    newline  -- the line separator, '' for csv files. Defaults to '\\n'"""
+    encoding = encoding or sniffencoding(path)
+    if PY3:
+        with io.open(path, 'r', encoding=encoding, newline=newline) as f:
+            yield f
+    elif codecs.lookup(encoding).name in ('utf-8', 'utf-8-sig'):
+        with open(path, 'rb') as f:
+            if encoding == 'utf-8-sig' and f.read(len(codecs.BOM_UTF8)) != codecs.BOM_UTF8:
+                f.seek(0)
+            yield f
+    else:
+        with io.open(path, 'r', encoding=encoding, newline=newline) as f:
+            yield (line.encode('utf-8') for line in f)
+
+# size of the chunks decoded by maptext
+textchunksize = 1 << 18
+
+@contextlib.contextmanager
+def maptext(path, encoding=None, chunksize=textchunksize):
+    """Context manager memory mapping a text file, yielding an iterator over its lines as str, 
+    without their line separator. The file is decoded in chunks instead of a line at a time,
+    and the lines are split from the decoded chunks.
+    In Python 2 the lines are utf-8 encoded, see opentext.
+
+    Keyword arguments:
+    path      -- the file path
+    encoding  -- the encoding of the file. Defaults to None, i-e found by detectencoding
+    chunksize -- the number of bytes decoded at once. Defaults to textchunksize"""
+    with open(path, 'rb') as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty files can not be mapped
+            yield iter(())
+            return
+    try:
+        yield itertools.chain.from_iterable(maplines(data, encoding or detectencoding(data[:64]), chunksize))
+    finally:
+        data.close()
+
+def maplines(data, encoding, chunksize):
+    """Returns a generator over the lists of the lines of the decoded chunks of data, see maptext"""
+    (start, decode) = (0, None)
+    if PY3 or not codecs.lookup(encoding).name in ('utf-8', 'utf-8-sig'):
+        decode = codecs.getincrementaldecoder(encoding)().decode
+    elif encoding == 'utf-8-sig' and data[:len(codecs.BOM_UTF8)] == codecs.BOM_UTF8:
+        start = len(codecs.BOM_UTF8)
+    length = len(data)
+    # the start of the last line of the previous chunk
+    pending = ''
+    for offset in xrange(start, length, chunksize):
+        chunk = data[offset:offset + chunksize]
+        if decode:
+            chunk = decode(chunk, offset + chunksize >= length)
+            if not PY3:
+                chunk = chunk.encode('utf-8')
+        lines = (pending + chunk).split('\n')
+        pending = lines.pop()
+        yield lines
+    if pending:
+        yield [pending]
+
+def textencoder(encoding):
+    """Returns the function encoding the text written to a file, the utf-16 byte order mark
+    being only written before the first text. Returns None in Python 2 for utf-8,
+    the text being already encoded"""
+    encode = codecs.getincrementalencoder(encoding)().encode
+    if PY3:
+        return encode
+    if codecs.lookup(encoding).name == 'utf-8':
+        return None
+    return lambda s: encode(s.decode('utf-8'))
+
+class AtomicFile:
+    """File object writing to a temporary file next to path, that replaces the file
+    at path once it has been written and closed without error.
+    Used as a context manager, e.g:
+        with AtomicFile(path) as f:
+            f.write(s)
+
+    If skipunchanged is True, what is written is compared with the existing file
+    as it is written, and nothing is written until a difference is found.
+    The file is then left untouched (changed is False) if the content is identical.
+
+    If encoding is provided, the text written is encoded (see textencoder) 
+    and the file is binary."""
+
+    def __init__(self, path, mode='w', buffering=-1, skipunchanged=False, encoding=None):
+        self.path = path
+        self.mode = mode
+        self.buffering = buffering
+        self.encoding = encoding
+        self.__encode = None
+        if encoding:
+            self.__encode = textencoder(encoding)
+            if not 'b' in mode:
+                self.mode += 'b'
+        self.temppath = '{}.{}-{}.tmp'.format(path, os.getpid(), threading.current_thread().ident)
+        self.changed = True
+        self.__temp = None
+        # the existing file, while the written content is identical
+        self.__existing = None
+        self.__matched = 0
+        if skipunchanged:
+            try:
+                self.__existing = open(path, 'rb')
+            except IOError:
+                pass
+        if not self.__existing:
+            self.__opentemp()
+
+    def __opentemp(self, pending=None):
+        """Opens the temporary file, writing first the content identical to the existing file
+        and the pending bytes that differ from it"""
+        self.__temp = open(self.temppath, self.mode, self.buffering)
+        if self.__existing:
+            self.__existing.seek(0)
+            remaining = self.__matched
+            while remaining > 0:
+                chunk = self.__existing.read(min(remaining, 1 << 16))
+                self.__temp.write(chunk)
+                remaining -= len(chunk)
+            self.__existing.close()
+            self.__existing = None
+        if pending:
+            self.__temp.write(pending)
+        # no need to compare anymore, writing directly
+        if self.encoding and PY3:
+            # the byte order mark is only written at the start of the file
+            self.__temp = io.TextIOWrapper(self.__temp, self.encoding, newline='')
+            self.write = self.__temp.write
+        elif self.__encode:
+            (write, encode) = (self.__temp.write, self.__encode)
+            self.write = lambda s: write(encode(s))
+        else:
+            self.write = self.__temp.write
+
+    def write(self, s):
+        if not self.__existing:  # called through a method bound while comparing, e.g by a csv writer
+            return self.write(s)
+        if self.__encode:
+            s = self.__encode(s)
+        # only called while comparing, see __opentemp
+        if self.__existing.read(len(s)) == s:
+            self.__matched += len(s)
+        else:
+            self.__opentemp(s)
+
+    def close(self):
+        """Replaces the file at path, unless the content was identical"""
+        if self.__existing:
+            if not self.__existing.read(1):
+                self.__existing.close()
+                self.__existing = None
+                self.changed = False
+                return
+            self.__opentemp()
+        self.__temp.close()
+        os.rename(self.temppath, self.path)
+
+    def discard(self):
+        """Closes the files, leaving the file at path untouched"""
+        for f in (self.__existing, self.__temp):
+            if f:
+                f.close()
+        if os.path.exists(self.temppath):
+            os.remove(self.temppath)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type:
+            self.discard()
+        else:
+            self.close()
+        return False
+
 class LangError(Exception):
     """Base class for exception created by this script"""
 
@@ -37,42 +396,286 @@ class LangParseError(LangError):
     def prefix(cls):
         return 'ParseError'
 
-class LanguageElement:
-    """Class encapsulating the key of the string and the different values."""
+class LRUCache:
+    """Dictionary-like cache holding at most maxsize items, 
+    the least recently used item being discarded when it is full."""
+
+    def __init__(self, maxsize=1 << 16):
+        self.maxsize = maxsize
+        # key -> [previous, next, key, value], in a circular list from the least recently used
+        self.__links = {}
+        self.__root = []
+        self.__root[:] = [self.__root, self.__root, None, None]
+
+    def __len__(self):
+        return len(self.__links)
+
+    def __contains__(self, key):
+        return key in self.__links
+
+    def get(self, key, default=None):
+        """Returns the value of a key, marking it as recently used, or default"""
+        link = self.__links.get(key)
+        if link is None:
+            return default
+        root = self.__root
+        if link[1] is not root:
+            # unlinking and moving before the root
+            (previous, next) = (link[0], link[1])
+            previous[1] = next
+            next[0] = previous
+            last = root[0]
+            last[1] = root[0] = link
+            link[0] = last
+            link[1] = root
+        return link[3]
+
+    def __setitem__(self, key, value):
+        link = self.__links.get(key)
+        if link is not None:
+            link[3] = value
+            self.get(key)
+            return
+        root = self.__root
+        if len(self.__links) >= self.maxsize:
+            oldest = root[1]
+            root[1] = oldest[1]
+            oldest[1][0] = root
+            del self.__links[oldest[2]]
+        last = root[0]
+        link = [last, root, key, value]
+        last[1] = root[0] = self.__links[key] = link
+
+    def clear(self):
+        self.__links.clear()
+        self.__root[:] = [self.__root, self.__root, None, None]
+
+class LanguageColumns:
+    """Per language columns of string values, indexed by row.
+    Each keyed element owns a row, so that a value is a single list slot
+    instead of a dictionary entry per element.
+
+    The rows missing a value are indexed per language as values are set,
+    so that missing values can be counted without scanning the columns.
+
+    Identical values can share a single object through a pool, whatever their
+    language or table, so that the values left untranslated or repeated across
+    keys are only stored once. The pool costs a dictionary entry per distinct
+    value, more than it saves unless many values are repeated."""
+
+    def __init__(self, pool=False):
+        """Keyword arguments:
+
+        pool -- if True, identical values share a single object. Defaults to False"""
+        # language -> list of values (None where missing)
+        self.columns = {}
+        # language -> set of the rows without value
+        self.missing = {}
+        # the key of each row
+        self.keys = []
+        # value -> the shared object of the value, None if values are not pooled
+        self.pool = {} if pool else None
+        # the languages whose values were not all set through the pool, see loadcolumns
+        self.unpooled = set()
+
+    def newrow(self, key=None):
+        """Allocates a row and returns its index
+
+        Keyword arguments:
+        key -- the key of the element owning the row"""
+        row = len(self.keys)
+        self.keys.append(key)
+        for rows in self.missing.values():
+            rows.add(row)
+        return row
+
+    def get(self, language, row):
+        """Returns the value of a row for a language, or None"""
+        column = self.columns.get(language)
+        if column is None or row >= len(column):
+            return None
+        return column[row]
+
+    def set(self, language, row, value):
+        """Sets the value of a row for a language"""
+        column = self.columns.get(language)
+        if column is None:
+            language = intern(language)
+            column = self.columns[language] = []
+            self.missing[language] = set(xrange(len(self.keys)))
+        if row >= len(column):
+            column.extend([None] * (row + 1 - len(column)))
+        if value is None:
+            self.missing[language].add(row)
+        else:
+            if self.pool is not None:
+                value = self.pool.setdefault(value, value)
+            self.missing[language].discard(row)
+        column[row] = value
+
+    def missingcount(self, language):
+        """Returns the number of rows without value for a language"""
+        rows = self.missing.get(language)
+        if rows is None:
+            return len(self.keys)
+        return len(rows)
+
+    def missingrows(self, language):
+        """Returns the set of the rows without value for a language"""
+        rows = self.missing.get(language)
+        if rows is None:
+            return set(xrange(len(self.keys)))
+        return rows
+
+    def rowvalues(self, row):
+        """Returns the dictionary of the values of a row by language"""
+        return dict((l, c[row]) for (l, c) in self.columns.items() 
+                    if row < len(c) and c[row] is not None)
+
+    def columnvalues(self, language, rows):
+        """Returns the list of the values of the provided rows for a language, None where missing"""
+        column = self.columns.get(language, [])
+        length = len(column)
+        return [column[row] if row is not None and row < length else None for row in rows]
+
+    def missingkeys(self, language):
+        """Returns the set of the keys of the rows without value for a language"""
+        return set(self.keys[row] for row in self.missingrows(language))
+
+    def duplicatekeys(self, language):
+        """Returns a dictionary of the keys of the rows sharing a value for a language,
+        by value, for the values of at least two rows.
+        When the values are pooled, the identical values are the object of their pool entry,
+        and the rows are grouped by pool entry instead of hashing and comparing the values again."""
+        column = self.columns.get(language, [])
+        if self.pool is None or language in self.unpooled:
+            keys = {}
+            for (row, value) in enumerate(column):
+                if value is not None:
+                    keys.setdefault(value, []).append(self.keys[row])
+            return dict((value, shared) for (value, shared) in keys.items() if len(shared) > 1)
+        # pool entry -> rows
+        entries = {}
+        for (row, value) in enumerate(column):
+            if value is not None:
+                entries.setdefault(id(value), []).append(row)
+        return dict((column[rows[0]], [self.keys[row] for row in rows]) for rows in entries.values() if len(rows) > 1)
+
+    def loadcolumns(self, languages, rows, keys, columns, missing):
+        """Sets the values of rows allocated at once, e.g from a snapshot
+
+        Keyword arguments:
+        languages -- the languages
+        rows      -- the rows, which must be the first ones, in order
+        keys      -- the key of each row
+        columns   -- per language, the list of the values of the rows (None if missing)
+        missing   -- per language, the set of the indices of the rows without value
+
+        The values are not added to the pool, which would slow the loading
+        of snapshots down, marshal already sharing the values shared when saved."""
+        assert rows == list(range(len(self.keys), len(self.keys) + len(rows))), 'Rows must be allocated in order'
+        self.keys.extend(keys)
+        for (language, values, indices) in zip(languages, columns, missing):
+            language = intern(language)
+            self.unpooled.add(language)
+            self.columns[language] = values
+            self.missing[language] = indices
+
+class LanguageElement(object):
+    """Class encapsulating the key of the string and the different values.
+    The values are stored in the row of a LanguageColumns instance,
+    which is usually shared by all the elements of a resource.
+    The element belongs to the table of the .strings file it comes from, if any."""
+
+    # elements are numerous, no instance dictionary
+    __slots__ = ('key', 'comment', 'columns', 'row', 'table', '_prev', '_next')
 
     # regex used to properly strip "pretty" (with repeated *) multiline comments
     pc_pattern = re.compile(r'^[ \t\f\v]*\*?[ \t\f\v]*(.*)$',re.MULTILINE)
 
-    def __init__(self, key='', comment=''):
+    # regex matching the comment introducing the elements of a table, see bannercomment
+    banner_pattern = re.compile(r'\A=+\nTable : (.+)\n=+\Z')
+
+    def __init__(self, key='', comment='', columns=None, table=None):
         """Keyword Arguments:
 
-        key    -- The string key. Must not be None, must be normalized.
-        values -- A list containing the different values"""
+        key     -- The string key. Must not be None, must be normalized.
+        comment -- The comment
+        columns -- The LanguageColumns storing the values, created when needed if None
+        table   -- The table name (e.g Localizable for Localizable.strings), None if it has no table"""
         self.key = key
-        self.values = {}
-        self.comment = "\n".join(self.pc_pattern.findall(comment.strip()))
+        self.comment = self.normalizecomment(comment) if comment else ''
+        self.columns = columns
+        self.table = table
+        # allocated with the first value
+        self.row = None
+        # links maintained by LanguageElementStore
+        self._prev = None
+        self._next = None
 
     #regex used to normalize keys
     #TODO:  Normalizing keys is not a good idea because people might use 
     #       accents in their string keys and this will then change the 
     #       key in the output...
-    key_pattern = re.compile('[^\w\s_]+')
+    key_pattern = re.compile(r'[^\w\s_]+', asciiflag)
+    # keys that are left unchanged by the normalization
+    plainkey_pattern = re.compile(r'[\w\s]*\Z', asciiflag)
+    nonascii_pattern = re.compile('[^\x00-\x7f]')
+    # the normalized keys that are not plain, a key being usually normalized once per language
+    key_cache = LRUCache(1 << 16)
+
+    @classmethod
+    def normalizecomment(cls, comment):
+        """Strips a comment and the leading * of its lines"""
+        return "\n".join(cls.pc_pattern.findall(comment.strip()))
+
+    @classmethod
+    def bannercomment(cls, table):
+        """Returns the comment introducing the elements of a table in the files without tables, 
+        i-e csv and android files"""
+        return '======================\nTable : ' + table + '\n======================'
+
+    @classmethod
+    def bannertable(cls, comment):
+        """Returns the table introduced by a comment (see bannercomment), or None if it is not a banner"""
+        if not comment or not '=' in comment:
+            return None
+        match = cls.banner_pattern.match(cls.normalizecomment(comment))
+        return match and match.group(1)
+
     @classmethod
     def normalizekey(cls, key):
         """Normalizes keys between android and ios"""
-        u = unicodedata.normalize('NFKD', unicode(key, 'utf-8'))
-        formattedKey = u.encode('ascii', 'ignore')
-        return cls.key_pattern.sub(' ', formattedKey)
+        if cls.plainkey_pattern.match(key):  # cheaper than a cache lookup
+            return key
+        formattedKey = cls.key_cache.get(key)
+        if formattedKey is None:
+            if not cls.nonascii_pattern.search(key):  # NFKD does not change ascii strings
+                formattedKey = cls.key_pattern.sub(' ', key)
+            else:
+                if PY3:
+                    formattedKey = unicodedata.normalize('NFKD', key).encode('ascii', 'ignore').decode('ascii')
+                else:
+                    formattedKey = unicodedata.normalize('NFKD', key.decode('utf-8')).encode('ascii', 'ignore')
+                formattedKey = cls.key_pattern.sub(' ', formattedKey)
+            cls.key_cache[key] = formattedKey
+        return formattedKey
+
+    @property
+    def values(self):
+        """Dictionary of the values by language"""
+        if self.row is None:
+            return {}
+        return self.columns.rowvalues(self.row)
 
     def getvalue(self, language):
         """Getter for string value
 
         Keyword Arguments:
         language -- the language your want the value for"""
-        try:
-            return self.values[language]
-        except KeyError, IndexError:
+        if self.row is None:
             return None
+        return self.columns.get(language, self.row)
 
     def setvalue(self, language, value):
         """setter for string value
@@ -82,7 +685,11 @@ class LanguageElement:
         value    -- the value"""
         assert self.key, 'Tried to set a value {} without a key'.format(value)
         if value:
-            self.values[language] = value
+            if self.row is None:
+                if self.columns is None:
+                    self.columns = LanguageColumns()
+                self.row = self.columns.newrow(self.key)
+            self.columns.set(language, self.row, value)
 
     def csv_columns(self, languages):
         """Convernience method that returns a generator 
@@ -91,15 +698,33 @@ class LanguageElement:
         a.extend(((self.getvalue(l) or '') for l in languages))
         return a
 
-    # def androidline(self, language):
-    #     """Returns a string corresponding to the android line for the language
+    # regex matching the quotes to escape in android values, escaped characters being skipped
+    android_quote_pattern = re.compile(r'\\.|[\'"]')
 
-    #     Keyword arguments:
-    #     languageIndex --  the language index (defaults to 0)
-    #     """
-    #     formattedKey = self.key.replace(' ', '_')
-    #     formattedValue = xml_escape(self.values[language])
-    #     return '<string name="{}">{}</string>'.format(formattedKey, formattedValue)
+    @classmethod
+    def android_escape(cls, value):
+        """Escapes a value for an android strings file"""
+        value = cls.android_quote_pattern.sub(lambda m: m.group() if len(m.group()) > 1 else '\\' + m.group(), 
+                                              xml_escape(value))
+        if value[0] in '@?':  # would be a reference
+            value = '\\' + value
+        return value
+
+    def android_line(self, language):
+        """Returns a string corresponding to the android lines for the language,
+        or None if there is nothing to write.
+
+        Keyword arguments:
+        language -- the language
+        """
+        lines = []
+        if self.comment:
+            lines.append('    <!-- {} -->'.format(self.comment.replace('--', '- -')))
+        value = self.getvalue(language)
+        if self.key and value:
+            formattedKey = xml_escape(re.sub(r'\s', '_', self.key), {'"' : '&quot;'})
+            lines.append('    <string name="{}">{}</string>'.format(formattedKey, self.android_escape(value)))
+        return '\n'.join(lines) or None
 
     def cocoa_line(self, language):
         """Convenience method that returns a string corresponding 
@@ -129,38 +754,1280 @@ class LanguageElement:
     def __str__(self):
         return str({ 'key' : self.key, 'values' : self.values, 'comment' : self.comment })
 
+class LanguageElementStore:
+    """Ordered container of LanguageElement instances.
+
+    The elements are chained in a doubly linked list so that an element
+    can be inserted after any other one in constant time. Keyed elements
+    are also indexed by key. The elements themselves are used as position
+    handles, None meaning the end of the store."""
+
+    def __init__(self):
+        # sentinel element closing the circular list
+        self.__root = LanguageElement()
+        self.__root._prev = self.__root._next = self.__root
+        self.__keyed = {}
+        self.__count = 0
+
+    def __len__(self):
+        return self.__count
+
+    def __iter__(self):
+        element = self.__root._next
+        while element is not self.__root:
+            yield element
+            element = element._next
+
+    def languageelements(self, language):
+        """Returns an iterator over the elements in order, when only the values of a language are used
+
+        Keyword arguments:
+        language -- the language whose values are used"""
+        return iter(self)
+
+    def keyedelements(self):
+        """Returns a generator over the elements having a key, in order"""
+        return (e for e in self if e.key)
+
+    def tables(self, default, language=None):
+        """Returns the tables of the elements in order
+
+        Keyword arguments:
+        default  -- the table of the elements without table
+        language -- if provided, only the tables of the elements with a value in that language"""
+        tables = []
+        for element in self:
+            if language and not (element.key and element.getvalue(language)):
+                continue
+            table = element.table or default
+            if not tables or tables[-1] != table and not table in tables:
+                tables.append(table)
+        return tables
+
+    def keyedcount(self):
+        """Returns the number of elements having a key"""
+        return len(self.__keyed)
+
+    def get(self, key):
+        """Returns the element corresponding to the provided key, or None
+
+        Keyword arguments:
+        key -- the key"""
+        return self.__keyed.get(key)
+
+    def last(self):
+        """Returns the last element, or None if the store is empty"""
+        if self.__root._prev is self.__root:
+            return None
+        return self.__root._prev
+
+    def following(self, element):
+        """Returns the element following the provided one.
+        If the provided element is the last one (or None), it is returned as is.
+
+        Keyword arguments:
+        element -- an element of the store, or None"""
+        if element is None or element._next is self.__root:
+            return element
+        return element._next
+
+    def insert(self, element, after=None):
+        """Inserts an element and returns it.
+        Raises a LangError if an element already exists for its key.
+
+        Keyword arguments:
+        element -- the LanguageElement
+        after   -- the element after which it is inserted, defaults to None i-e the end of the store"""
+        if element.key:
+            if element.key in self.__keyed:
+                raise LangError("Element already exists for key '{}'".format(element.key))
+            self.__keyed[element.key] = element
+        if after is None:
+            after = self.__root._prev
+        element._prev = after
+        element._next = after._next
+        after._next._prev = element
+        after._next = element
+        self.__count += 1
+        return element
+
+    def extend(self, elements):
+        """Appends elements at the end of the store, e.g to build it at once.
+        Raises a LangError if an element already exists for the key of one of them.
+
+        Keyword arguments:
+        elements -- a list of LanguageElement"""
+        last = self.__root._prev
+        for element in elements:
+            if element.key:
+                if element.key in self.__keyed:
+                    raise LangError("Element already exists for key '{}'".format(element.key))
+                self.__keyed[element.key] = element
+            element._prev = last
+            last._next = element
+            last = element
+        last._next = self.__root
+        self.__root._prev = last
+        self.__count += len(elements)
+
+    def settable(self, element, table):
+        """Sets the table of an element of the store"""
+        element.table = table
+
+class SQLiteElement(LanguageElement):
+    """Element of a SQLiteElementStore.
+    Its values are read from the database when they were not read with the element,
+    and are written through to the database when they are set."""
+
+    __slots__ = ('id', 'cache', 'cachelanguage')
+
+    def __init__(self, id, key, comment, table, columns, values=None, cachelanguage=None):
+        """Keyword Arguments:
+
+        id            -- the id of the element in the database
+        key           -- the key, '' for comments
+        comment       -- the comment, already normalized
+        table         -- the table, or None
+        columns       -- the SQLiteColumns storing the values
+        values        -- the dictionary of the values by language, read when needed if None
+        cachelanguage -- if provided, values only contains the value of this language"""
+        LanguageElement.__init__(self, key, None, columns, table)
+        self.comment = comment or ''
+        self.id = id
+        self.row = id if key else None
+        self.cache = values
+        self.cachelanguage = cachelanguage
+
+    @property
+    def values(self):
+        """Dictionary of the values by language"""
+        if self.row is None:
+            return {}
+        if self.cache is None or self.cachelanguage:
+            return self.columns.rowvalues(self.row)
+        return dict(self.cache)
+
+    def getvalue(self, language):
+        if self.row is None:
+            return None
+        if self.cache is None or (self.cachelanguage and self.cachelanguage != language):
+            return self.columns.get(language, self.row)
+        return self.cache.get(language)
+
+    def setvalue(self, language, value):
+        assert self.key, 'Tried to set a value {} without a key'.format(value)
+        if value:
+            self.columns.set(language, self.row, value)
+            if self.cache is not None:
+                self.cache[language] = value
+
+class SQLiteBatch:
+    """The rows written to a SQLite database while feeding, buffered and inserted
+    with executemany instead of a few statements per element and value.
+    Only the elements appended at the end of the store are buffered, and the buffered
+    elements and values are read from the buffer, so that feeding a file writes them
+    in chunks of size rows, and the last chunk once it is committed
+    (see SQLiteElementStore.commit) or when they are queried."""
+
+    # number of buffered rows above which they are written, the key lookups of a feed
+    # being slower with larger chunks pending
+    size = 1 << 10
+
+    def __init__(self, connection):
+        """Keyword Arguments:
+
+        connection -- the database connection, see SQLiteElementStore.connect"""
+        self.connection = connection
+        # the SQLiteElement appended at the end of the store, in order, and by key
+        self.elements = []
+        self.keyed = {}
+        # the element after which they are appended
+        self.tail = None
+        # the last element of the store, None if it must be read from the database
+        self.last = None
+        # the id of the next element, None if it must be read from the database
+        self.nextid = None
+        # row -> language -> value, None when the value is deleted
+        self.values = {}
+        self.valuecount = 0
+
+    def newid(self):
+        """Returns the id of a new element"""
+        if self.nextid is None:
+            self.nextid = self.connection.execute('SELECT max(id) FROM elements').fetchone()[0] + 1
+        self.nextid += 1
+        return self.nextid - 1
+
+    def append(self, element):
+        """Buffers an element appended at the end of the store
+
+        Keyword arguments:
+        element -- the SQLiteElement, whose id was returned by newid"""
+        if not self.elements:
+            self.tail = self.last
+        self.elements.append(element)
+        if element.key:
+            self.keyed[element.key] = element
+        self.last = element.id
+        if len(self.elements) + self.valuecount > self.size:
+            self.flush()
+
+    def setvalue(self, row, language, value):
+        """Buffers a value, None to delete it"""
+        values = self.values.get(row)
+        if values is None:
+            values = self.values[row] = {}
+        values[language] = value
+        self.valuecount += 1
+        if len(self.elements) + self.valuecount > self.size:
+            self.flush()
+
+    def flushelements(self):
+        """Writes the buffered elements, linked after the tail.
+        Raises a LangError if an element already exists for the key of one of them."""
+        if not self.elements:
+            return
+        ids = [e.id for e in self.elements]
+        rows = [(e.id, e.key or None, e.comment, e.table, prev, next) 
+                for (e, prev, next) in izip(self.elements, [self.tail] + ids[:-1], ids[1:] + [0])]
+        (self.elements, self.keyed) = ([], {})
+        try:
+            self.connection.executemany('INSERT INTO elements (id, key, comment, tbl, prev, next) VALUES (?, ?, ?, ?, ?, ?)', rows)
+        except sqlite3.IntegrityError as e:
+            raise LangError('Element already exists for a key: ' + str(e))
+        self.connection.execute('UPDATE elements SET next = ? WHERE id = ?', (ids[0], self.tail))
+        self.connection.execute('UPDATE elements SET prev = ? WHERE id = 0', (ids[-1],))
+
+    def flush(self):
+        """Writes the buffered elements and values"""
+        self.flushelements()
+        if self.values:
+            (values, self.values, self.valuecount) = (self.values, {}, 0)
+            self.connection.executemany('INSERT OR REPLACE INTO vals (row, language, value) VALUES (?, ?, ?)', 
+                                        ((row, l, v) for (row, languages) in values.items() for (l, v) in languages.items() if v is not None))
+            self.connection.executemany('DELETE FROM vals WHERE row = ? AND language = ?', 
+                                        ((row, l) for (row, languages) in values.items() for (l, v) in languages.items() if v is None))
+
+    def reset(self):
+        """Forgets the buffered rows and what was read from the database, e.g once it is emptied"""
+        (self.elements, self.keyed, self.values, self.valuecount) = ([], {}, {}, 0)
+        (self.tail, self.last, self.nextid) = (None, None, None)
+
+class SQLiteElementStore:
+    """Ordered container of elements stored in a SQLite database, 
+    used instead of LanguageElementStore when the elements do not fit in memory.
+
+    The order is a doubly linked list in the elements table, closed by the
+    element 0, and the keys are indexed. Elements are returned as SQLiteElement
+    handles, which are also the position handles. The changes are written in
+    a transaction committed by commit, in batches (see SQLiteBatch)."""
+
+    # version of the tables, stored as the user_version of the database
+    schemaversion = 2
+
+    def __init__(self, connection, columns):
+        """Keyword Arguments:
+
+        connection -- the database connection, see connect
+        columns    -- the SQLiteColumns of the same database"""
+        self.connection = connection
+        self.columns = columns
+        self.batch = columns.batch
+
+    @classmethod
+    def connect(cls, path):
+        """Opens a database, creating its tables if needed, and returns the connection.
+        Raises a LangError if its tables have another version.
+
+        Keyword arguments:
+        path -- the database file path, or ':memory:'"""
+        connection = sqlite3.connect(path)
+        connection.text_factory = str
+        # the database is a working copy of the sources
+        connection.execute('PRAGMA synchronous = OFF')
+        (version,) = connection.execute('PRAGMA user_version').fetchone()
+        if version and version != cls.schemaversion:
+            raise LangError('Unsupported database version {} in {}'.format(version, path))
+        connection.executescript('''
+            CREATE TABLE IF NOT EXISTS elements (id INTEGER PRIMARY KEY, key TEXT UNIQUE, comment TEXT NOT NULL, tbl TEXT,
+                                                 prev INTEGER NOT NULL, next INTEGER NOT NULL);
+            INSERT OR IGNORE INTO elements (id, key, comment, prev, next) VALUES (0, NULL, '', 0, 0);
+            CREATE TABLE IF NOT EXISTS vals (row INTEGER NOT NULL, language TEXT NOT NULL, value TEXT NOT NULL,
+                                             PRIMARY KEY (row, language)) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS vals_language ON vals (language, row);
+            CREATE TABLE IF NOT EXISTS languages (position INTEGER PRIMARY KEY, language TEXT NOT NULL);
+            PRAGMA user_version = {};'''.format(cls.schemaversion))
+        connection.commit()
+        return connection
+
+    def __element(self, id):
+        """Returns the handle of an element"""
+        (key, comment, table) = self.connection.execute('SELECT key, comment, tbl FROM elements WHERE id = ?', (id,)).fetchone()
+        return SQLiteElement(id, key or '', comment, table, self.columns)
+
+    def __link(self, id):
+        """Returns (prev, next) of an element"""
+        return self.connection.execute('SELECT prev, next FROM elements WHERE id = ?', (id,)).fetchone()
+
+    def __len__(self):
+        self.batch.flush()
+        return self.connection.execute('SELECT count(*) FROM elements WHERE id != 0').fetchone()[0]
+
+    # the elements in order, with their values, formatted with a condition on the values
+    ordered_query = '''
+        WITH RECURSIVE chain(id, position) AS (
+            SELECT next, 1 FROM elements WHERE id = 0 AND next != 0
+            UNION ALL
+            SELECT elements.next, chain.position + 1 FROM chain JOIN elements ON elements.id = chain.id 
+            WHERE elements.next != 0)
+        SELECT elements.id, elements.key, elements.comment, elements.tbl, vals.language, vals.value
+        FROM chain JOIN elements ON elements.id = chain.id LEFT JOIN vals ON vals.row = elements.id{}
+        ORDER BY chain.position'''
+
+    def __iter__(self):
+        """Iterates over the elements and their values with a single query"""
+        self.batch.flush()
+        element = None
+        for (id, key, comment, table, language, value) in self.connection.execute(self.ordered_query.format('')):
+            if element is None or element.id != id:
+                if element is not None:
+                    yield element
+                element = SQLiteElement(id, key or '', comment, table, self.columns, {})
+            if language is not None:
+                element.cache[language] = value
+        if element is not None:
+            yield element
+
+    def languageelements(self, language):
+        """Returns a generator over the elements in order, reading only the values of a language
+
+        Keyword arguments:
+        language -- the language whose values are used"""
+        self.batch.flush()
+        query = self.ordered_query.format(' AND vals.language = ?')
+        for (id, key, comment, table, _, value) in self.connection.execute(query, (language,)):
+            yield SQLiteElement(id, key or '', comment, table, self.columns, {language : value} if value is not None else {}, language)
+
+    def keyedelements(self):
+        """Returns a generator over the elements having a key, in order"""
+        return (e for e in self if e.key)
+
+    def tables(self, default, language=None):
+        """Returns the tables of the elements, in the order they were created
+
+        Keyword arguments:
+        default  -- the table of the elements without table
+        language -- if provided, only the tables of the elements with a value in that language"""
+        self.batch.flush()
+        tables = []
+        if language:
+            rows = self.connection.execute('SELECT tbl FROM elements JOIN vals ON row = id WHERE language = ? GROUP BY tbl ORDER BY min(id)', (language,))
+        else:
+            rows = self.connection.execute('SELECT tbl FROM elements WHERE id != 0 GROUP BY tbl ORDER BY min(id)')
+        for (table,) in rows:
+            table = table or default
+            if not table in tables:
+                tables.append(table)
+        return tables
+
+    def keyedcount(self):
+        """Returns the number of elements having a key"""
+        self.batch.flush()
+        return self.connection.execute('SELECT count(*) FROM elements WHERE key IS NOT NULL').fetchone()[0]
+
+    def get(self, key):
+        """Returns the element corresponding to the provided key, or None
+
+        Keyword arguments:
+        key -- the key"""
+        element = self.batch.keyed.get(key)
+        if element is not None:
+            return element
+        row = self.connection.execute('SELECT id, comment, tbl FROM elements WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        return SQLiteElement(row[0], key, row[1], row[2], self.columns)
+
+    def last(self):
+        """Returns the last element, or None if the store is empty"""
+        if self.batch.elements:
+            return self.batch.elements[-1]
+        (prev, _) = self.__link(0)
+        if not prev:
+            return None
+        return self.__element(prev)
+
+    def following(self, element):
+        """Returns the element following the provided one.
+        If the provided element is the last one (or None), it is returned as is.
+
+        Keyword arguments:
+        element -- an element of the store, or None"""
+        if element is None:
+            return None
+        self.batch.flushelements()
+        (_, next) = self.__link(element.id)
+        if not next:
+            return element
+        return self.__element(next)
+
+    def insert(self, element, after=None):
+        """Inserts an element and returns its handle.
+        The elements appended at the end are buffered (see SQLiteBatch).
+        Raises a LangError if an element already exists for its key,
+        when it is written for the elements already in the database.
+
+        Keyword arguments:
+        element -- the LanguageElement, without values
+        after   -- the element after which it is inserted, defaults to None i-e the end of the store"""
+        batch = self.batch
+        if element.key in batch.keyed:
+            raise LangError("Element already exists for key '{}'".format(element.key))
+        if batch.last is None:
+            batch.last = self.__link(0)[0]
+        handle = SQLiteElement(batch.newid(), element.key, element.comment, element.table, self.columns, {})
+        if after is None or after.id == batch.last:
+            batch.append(handle)
+            return handle
+        batch.flushelements()
+        (_, next) = self.__link(after.id)
+        try:
+            self.connection.execute('INSERT INTO elements (id, key, comment, tbl, prev, next) VALUES (?, ?, ?, ?, ?, ?)', 
+                                    (handle.id, element.key or None, element.comment, element.table, after.id, next))
+        except sqlite3.IntegrityError:
+            raise LangError("Element already exists for key '{}'".format(element.key))
+        self.connection.execute('UPDATE elements SET next = ? WHERE id = ?', (handle.id, after.id))
+        self.connection.execute('UPDATE elements SET prev = ? WHERE id = ?', (handle.id, next))
+        return handle
+
+    def extend(self, elements):
+        """Appends elements at the end of the store in a single batch, 
+        and sets the row of the keyed ones.
+        Raises a LangError if an element already exists for the key of one of them.
+
+        Keyword arguments:
+        elements -- a list of LanguageElement, without values"""
+        if not elements:
+            return
+        self.batch.flush()
+        self.batch.reset()
+        (last, _) = self.__link(0)
+        first = self.connection.execute('SELECT max(id) FROM elements').fetchone()[0] + 1
+        rows = []
+        for (id, element) in enumerate(elements, first):
+            rows.append((id, element.key or None, element.comment, element.table, id - 1, id + 1))
+            element.row = id if element.key else None
+        rows[0] = rows[0][:4] + (last, rows[0][5])
+        rows[-1] = rows[-1][:5] + (0,)
+        try:
+            self.connection.executemany('INSERT INTO elements (id, key, comment, tbl, prev, next) VALUES (?, ?, ?, ?, ?, ?)', rows)
+        except sqlite3.IntegrityError as e:
+            raise LangError('Element already exists for a key: ' + str(e))
+        self.connection.execute('UPDATE elements SET next = ? WHERE id = ?', (first, last))
+        self.connection.execute('UPDATE elements SET prev = ? WHERE id = 0', (rows[-1][0],))
+
+    def settable(self, element, table):
+        """Sets the table of an element of the store"""
+        self.batch.flushelements()
+        element.table = table
+        self.connection.execute('UPDATE elements SET tbl = ? WHERE id = ?', (table, element.id))
+
+    def clear(self):
+        """Removes all the elements, their values and the languages"""
+        self.batch.reset()
+        self.connection.execute('DELETE FROM vals')
+        self.connection.execute('DELETE FROM elements WHERE id != 0')
+        self.connection.execute('UPDATE elements SET prev = 0, next = 0 WHERE id = 0')
+        self.connection.execute('DELETE FROM languages')
+
+    def languages(self):
+        """Returns the languages saved by commit"""
+        return [l for (l,) in self.connection.execute('SELECT language FROM languages ORDER BY position')]
+
+    def commit(self, languages):
+        """Saves the languages and commits the changes
+
+        Keyword arguments:
+        languages -- the languages of the resource"""
+        self.batch.flush()
+        self.connection.execute('DELETE FROM languages')
+        self.connection.executemany('INSERT INTO languages (position, language) VALUES (?, ?)', enumerate(languages))
+        self.connection.commit()
+
+class SQLiteColumns:
+    """Values of the elements of a SQLiteElementStore by language, see LanguageColumns.
+    The rows are the ids of the elements, and the values are indexed by row and by language.
+    Missing values are not stored, so that they are counted from the keyed elements."""
+
+    def __init__(self, connection):
+        """Keyword Arguments:
+
+        connection -- the database connection, see SQLiteElementStore.connect"""
+        self.connection = connection
+        # the rows not written yet, shared with the SQLiteElementStore
+        self.batch = SQLiteBatch(connection)
+
+    def newrow(self, key=None):
+        """Returns the row of the element of a key, allocated when it was inserted"""
+        self.batch.flushelements()
+        return self.connection.execute('SELECT id FROM elements WHERE key = ?', (key,)).fetchone()[0]
+
+    def get(self, language, row):
+        """Returns the value of a row for a language, or None"""
+        values = self.batch.values.get(row)
+        if values and language in values:
+            return values[language]
+        value = self.connection.execute('SELECT value FROM vals WHERE row = ? AND language = ?', (row, language)).fetchone()
+        return value and value[0]
+
+    def set(self, language, row, value):
+        """Sets the value of a row for a language, written with the next batch"""
+        self.batch.setvalue(row, language, value)
+
+    def rowvalues(self, row):
+        """Returns the dictionary of the values of a row by language"""
+        self.batch.flush()
+        return dict(self.connection.execute('SELECT language, value FROM vals WHERE row = ?', (row,)))
+
+    def columnvalues(self, language, rows):
+        """Returns the list of the values of the provided rows for a language, None where missing"""
+        self.batch.flush()
+        values = dict(self.connection.execute('SELECT row, value FROM vals WHERE language = ?', (language,)))
+        return [values.get(row) for row in rows]
+
+    def missingcount(self, language):
+        """Returns the number of rows without value for a language"""
+        self.batch.flush()
+        return self.connection.execute('SELECT (SELECT count(*) FROM elements WHERE key IS NOT NULL) - '
+                                       '(SELECT count(*) FROM vals WHERE language = ?)', (language,)).fetchone()[0]
+
+    # the keyed elements without value for a language
+    missing_query = 'SELECT {} FROM elements WHERE key IS NOT NULL AND id NOT IN (SELECT row FROM vals WHERE language = ?)'
+
+    def missingrows(self, language):
+        """Returns the set of the rows without value for a language"""
+        self.batch.flush()
+        return set(row for (row,) in self.connection.execute(self.missing_query.format('id'), (language,)))
+
+    def missingkeys(self, language):
+        """Returns the set of the keys of the rows without value for a language"""
+        self.batch.flush()
+        return set(key for (key,) in self.connection.execute(self.missing_query.format('key'), (language,)))
+
+    def duplicatekeys(self, language):
+        """Returns a dictionary of the keys of the rows sharing a value for a language,
+        by value, for the values of at least two rows"""
+        self.batch.flush()
+        keys = {}
+        for (value, key) in self.connection.execute('SELECT value, key FROM vals JOIN elements ON row = id WHERE language = ? AND value IN '
+                                                    '(SELECT value FROM vals WHERE language = ? GROUP BY value HAVING count(*) > 1)', 
+                                                    (language, language)):
+            keys.setdefault(value, []).append(key)
+        return keys
+
+    def loadcolumns(self, languages, rows, keys, columns, missing):
+        """Sets the values of rows in a single batch, see LanguageColumns.loadcolumns"""
+        self.batch.flush()
+        for (language, values) in zip(languages, columns):
+            self.connection.executemany('INSERT OR REPLACE INTO vals (row, language, value) VALUES (?, ?, ?)', 
+                                        ((row, language, value) for (row, value) in izip(rows, values) if value is not None))
+
+class CocoaStringsWriter:
+    """Streaming writer of cocoa .strings files.
+    Elements are written to the file as they are provided, separated by new lines.
+
+    When pretty is True, the white spaces between the end of a line and a
+    comment (i-e a line starting with /) are replaced by a blank line.
+    Since those white spaces can span several elements, they are held
+    until the next non white space character is known."""
+
+    # white spaces, as matched by \s
+    spaces = ' \t\n\r\f\v'
+    # regex matching the white spaces at a position
+    spaces_pattern = re.compile(r'\s*', asciiflag)
+
+    def __init__(self, f, language, pretty=False):
+        """Keyword Arguments:
+
+        f        -- the file object to write to
+        language -- the language of the values
+        pretty   -- if True, comments are preceded by a blank line"""
+        self.f = f
+        self.language = language
+        self.pretty = pretty
+        self.__first = True
+        # white spaces following a new line, None if not after a new line
+        self.__pending = None
+
+    def writeelement(self, element):
+        """Writes the cocoa line of an element"""
+        line = element.cocoa_line(self.language)
+        if self.__first:
+            self.__first = False
+            if self.pretty:
+                self.__writepretty(line)
+            else:
+                self.f.write(line)
+        elif not self.pretty:
+            self.f.write('\n' + line)
+        elif self.__pending == None and line and line[0] not in self.spaces and not '\n' in line:
+            # most lines: the new line is directly followed by the line's first character
+            self.f.write((line[0] == '/' and '\n\n' or '\n') + line)
+        else:
+            self.__writepretty('\n' + line)
+
+    def __writepretty(self, text):
+        (position, length) = (0, len(text))
+        while position < length:
+            if self.__pending != None:
+                end = self.spaces_pattern.match(text, position).end()
+                self.__pending += text[position:end]
+                if end == length:
+                    return
+                if text[end] == '/':
+                    self.f.write('\n\n')
+                else:
+                    self.f.write(self.__pending)
+                (self.__pending, position) = (None, end)
+            end = text.find('\n', position)
+            if end < 0:
+                self.f.write(text[position:])
+                return
+            self.f.write(text[position:end])
+            (self.__pending, position) = ('', end)
+
+    def close(self):
+        """Writes the white spaces that might still be held, does not close the file"""
+        if self.__pending:
+            self.f.write(self.__pending)
+        self.__pending = None
+
+class AndroidStringsTarget:
+    """Target of an XMLParser turning the strings of an android resources file 
+    into parse events (see LanguageResource.cocoa_parsestrings) as the file is fed.
+    No tree is built, only the text of the string being read is held.
+    Comments between the strings become comment elements, 
+    the other resources and the markup inside strings are ignored."""
+
+    def __init__(self):
+        self.events = []
+        self.__depth = 0
+        # name and text fragments of the string being read, the fragments being None outside of a string
+        self.__name = None
+        self.__text = None
+        self.__markup = False
+
+    @classmethod
+    def utf8(cls, s):
+        """The parser returns unicode for non ascii text, encoded in Python 2"""
+        if not PY3 and isinstance(s, unicode):
+            return s.encode('utf-8')
+        return s
+
+    def start(self, tag, attrib):
+        self.__depth += 1
+        if self.__text is not None:
+            self.__markup = True
+        elif self.__depth == 2:
+            if tag == 'string':
+                self.__name = self.utf8(attrib.get('name'))
+                self.__text = []
+                self.__markup = False
+            else:
+                self.events.append(('warning', 'ignoring unsupported android resource <{} name="{}">'.format(tag, self.utf8(attrib.get('name', '')))))
+
+    def end(self, tag):
+        if self.__depth == 2 and self.__text is not None:
+            value = self.utf8(u''.join(self.__text))
+            if not self.__name:
+                self.events.append(('warning', 'ignoring android string without name: "{}"'.format(value)))
+            else:
+                if self.__markup:
+                    self.events.append(('warning', 'ignoring the markup of android string {}'.format(self.__name)))
+                self.events.append(('element', self.__name, value, ''))
+            self.__text = None
+        self.__depth -= 1
+
+    def data(self, data):
+        if self.__text is not None:
+            self.__text.append(data)
+
+    def comment(self, text):
+        if self.__depth == 1:
+            self.events.append(('element', '', '', self.utf8(text.strip())))
+
+    def close(self):
+        return self.events
+
+def filedigest(path, prefix=''):
+    """Returns the hexadecimal sha1 digest of the content of a file, preceded by an ascii prefix"""
+    h = hashlib.sha1(prefix.encode('ascii'))
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def filefingerprint(path, known=None, prefix=''):
+    """Returns (size, mtime, hashtime, digest) of a file, digest being its filedigest.
+    The file is only hashed again if its size or modification time changed since known,
+    modification times being only trusted if the file was not modified while being hashed.
+    Returns known itself when it is still valid.
+
+    Keyword arguments:
+    path   -- the file path
+    known  -- the fingerprint previously returned for the file, or None
+    prefix -- the prefix of the digest, see filedigest"""
+    stat = os.stat(path)
+    if known and tuple(known[:2]) == (stat.st_size, stat.st_mtime) and stat.st_mtime < known[2] - 1:
+        return known
+    hashtime = time.time()
+    return (stat.st_size, stat.st_mtime, hashtime, filedigest(path, prefix))
+
+@contextlib.contextmanager
+def nocollection():
+    """Disables the garbage collector in a with statement, e.g while loading many objects at once,
+    which would trigger many useless collections"""
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if collecting:
+            gc.enable()
+
+class ParseCache:
+    """On-disk cache of the results of parsing files.
+
+    The results are stored with marshal, one file per content hash. The hash
+    of a file is recomputed only when its size or modification time changed
+    since it was last computed. When the cache grows over maxsize bytes,
+    the least recently used results are deleted.
+    The index is only written when save is called."""
+
+    # version of the parsed results, to be increased whenever parsing changes
+    formatversion = 2
+    indexname = 'index.bin'
+
+    def __init__(self, path, maxsize=256 << 20):
+        """Keyword Arguments:
+
+        path    -- the cache directory, created if needed
+        maxsize -- the maximum size in bytes of the cached results"""
+        self.path = path
+        self.maxsize = maxsize
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        # (path, kind) -> (size, mtime, hashtime, digest)
+        self.__files = {}
+        # digest -> [size, lastuse]
+        self.__entries = {}
+        try:
+            with open(os.path.join(path, self.indexname), 'rb') as f, nocollection():
+                (version, self.__files, self.__entries) = marshal.load(f)
+            if version != self.indexversion():
+                (self.__files, self.__entries) = ({}, {})
+        except (IOError, EOFError, ValueError, TypeError):
+            pass
+
+    @classmethod
+    def indexversion(cls):
+        """Returns the version of the index and the results, which also depends on the major version
+        of Python, the text being bytes in Python 2 and str in Python 3"""
+        return (cls.formatversion, sys.version_info[0])
+
+    def __entrypath(self, digest):
+        return os.path.join(self.path, digest + '.bin')
+
+    def __digest(self, path, kind):
+        """Returns the digest identifying the result of parsing the file"""
+        ident = (os.path.abspath(path), kind)
+        fingerprint = filefingerprint(path, self.__files.get(ident), '{}:{}:'.format(kind, self.indexversion()))
+        self.__files[ident] = fingerprint
+        return fingerprint[3]
+
+    def __load(self, digest):
+        """Returns the cached result, or None"""
+        if not digest in self.__entries:
+            return None
+        try:
+            with open(self.__entrypath(digest), 'rb') as f, nocollection():
+                result = marshal.load(f)
+        except (IOError, EOFError, ValueError, TypeError):
+            del self.__entries[digest]
+            return None
+        self.__entries[digest][1] = time.time()
+        return result
+
+    def __store(self, digest, result):
+        with AtomicFile(self.__entrypath(digest), 'wb') as f:
+            f.write(marshal.dumps(result))
+        self.__entries[digest] = [os.path.getsize(self.__entrypath(digest)), time.time()]
+        self.__evict()
+
+    def __evict(self):
+        """Deletes the least recently used results until the cache fits in maxsize"""
+        total = sum(e[0] for e in self.__entries.values())
+        if total <= self.maxsize:
+            return
+        for digest in sorted(self.__entries, key=lambda d: self.__entries[d][1]):
+            total -= self.__entries.pop(digest)[0]
+            try:
+                os.remove(self.__entrypath(digest))
+            except OSError:
+                pass
+            if total <= self.maxsize:
+                break
+
+    def get(self, path, kind, parse):
+        """Returns the result of parsing a file, calling parse(path) if it was not cached
+
+        Keyword arguments:
+        path  -- the file path
+        kind  -- the kind of parsing (e.g 'strings' or 'csv'), part of the key
+        parse -- the function parsing the file"""
+        digest = self.__digest(path, kind)
+        result = self.__load(digest)
+        if result == None:
+            result = parse(path)
+            self.__store(digest, result)
+        return result
+
+    def map(self, kind, parse, paths, mapfunction=imap):
+        """Returns a generator over the results of parsing the files, in order.
+        The files that were not cached are parsed with mapfunction(parse, paths),
+        e.g the imap function of a process pool.
+
+        Keyword arguments:
+        kind        -- the kind of parsing, part of the key
+        parse       -- the function parsing a file
+        paths       -- the file paths
+        mapfunction -- the function used to parse the missing files"""
+        digests = [self.__digest(path, kind) for path in paths]
+        scheduled = [not digest in self.__entries for digest in digests]
+        parsed = mapfunction(parse, [path for (path, s) in zip(paths, scheduled) if s])
+        for (path, digest, s) in zip(paths, digests, scheduled):
+            if s:
+                result = next(parsed)
+                self.__store(digest, result)
+            else:
+                result = self.__load(digest)
+                if result == None:  # deleted in the meantime
+                    result = parse(path)
+                    self.__store(digest, result)
+            yield result
+
+    def indexpath(self, path):
+        """Returns the path in the cache directory of the StringsIndex of a file"""
+        digest = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()
+        return os.path.join(self.path, digest + os.path.extsep + 'idx')
+
+    def save(self):
+        """Writes the index of the cache"""
+        with AtomicFile(os.path.join(self.path, self.indexname), 'wb') as f:
+            f.write(marshal.dumps((self.indexversion(), self.__files, self.__entries)))
+
+class StringsIndex:
+    """Sidecar index of a .strings file, mapping each normalized key to the byte offset
+    and length of its element in the file, so that a few values can be read without
+    parsing the whole file. The conflicts (elements not terminated by a ;) are not indexed,
+    and the first element of a key is the one indexed.
+
+    The index is built with a single scan of the file, and stored with marshal if an index
+    path is provided, e.g in a parse cache (see ParseCache.indexpath), so that the indexed 
+    files are left untouched. It is rebuilt when the file changed, i-e when its size or 
+    modification time changed and its content hash is different."""
+
+    # version of the stored index, to be increased whenever its content changes
+    formatversion = 1
+
+    def __init__(self, path, indexpath=None):
+        """Keyword Arguments:
+
+        path      -- the .strings file path
+        indexpath -- the index file path. Defaults to None, i-e the index is not stored"""
+        self.path = path
+        self.indexpath = indexpath
+        # (size, mtime, hashtime, digest) of the indexed file
+        self.__stat = None
+        # the encoding of the elements, without byte order mark
+        self.encoding = None
+        # normalized key -> (offset, length)
+        self.entries = {}
+        if indexpath:
+            try:
+                with open(self.indexpath, 'rb') as f, nocollection():
+                    (version, self.__stat, self.encoding, self.entries) = marshal.loads(f.read())
+                if version != self.indexversion():
+                    self.__stat = None
+            except (IOError, EOFError, ValueError, TypeError):
+                self.__stat = None
+        self.refresh()
+
+    @classmethod
+    def indexversion(cls):
+        """Returns the version of the index, see ParseCache.indexversion"""
+        return (cls.formatversion, sys.version_info[0])
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return LanguageElement.normalizekey(key) in self.entries
+
+    def refresh(self):
+        """Rebuilds the index if the file changed since it was built"""
+        known = self.__stat
+        fingerprint = filefingerprint(self.path, known)
+        if fingerprint is known:
+            return
+        if known and known[3] == fingerprint[3]:
+            self.__stat = fingerprint
+            self.__save()
+        else:
+            self.build()
+
+    @classmethod
+    def bareencoding(cls, encoding, start):
+        """Returns (encoding, length of the byte order mark) for a file encoding 
+        found by detectencoding, the encoding decoding the text after the byte order mark
+
+        Keyword Arguments:
+        encoding -- the encoding of the file
+        start    -- the first bytes of the file"""
+        if encoding == 'utf-8-sig':
+            return ('utf-8', len(codecs.BOM_UTF8) if start.startswith(codecs.BOM_UTF8) else 0)
+        if encoding == 'utf-16':
+            return ('utf-16-le' if start.startswith(codecs.BOM_UTF16_LE) else 'utf-16-be', len(codecs.BOM_UTF16_LE))
+        return (encoding, 0)
+
+    def build(self):
+        """Scans the file and writes its index"""
+        fingerprint = filefingerprint(self.path)
+        size = fingerprint[0]
+        with open(self.path, 'rb') as f:
+            start = f.read(64)
+        encoding = detectencoding(start)
+        (self.encoding, position) = self.bareencoding(encoding, start)
+
+        if not PY3 and codecs.lookup(self.encoding).name == 'utf-8':
+            length = len
+        elif not PY3:
+            length = lambda line: len(line.decode('utf-8').encode(self.encoding))
+        else:
+            length = lambda line: len(line.encode(self.encoding))
+        newline = len(u'\n'.encode(self.encoding))
+        # the offset of each line
+        offsets = []
+        def measured(lines, position):
+            for line in lines:
+                offsets.append(position)
+                position += length(line) + newline
+                yield line
+
+        spans = []
+        with maptext(self.path, encoding) as f:
+            LanguageResource.cocoa_parselines(measured(f, position), spans)
+        offsets.append(size)  # the end of the last line
+        self.entries = {}
+        for (key, first, last) in spans:
+            key = LanguageElement.normalizekey(key)
+            if not key in self.entries:
+                end = min(offsets[last], size)
+                self.entries[key] = (offsets[first - 1], end - offsets[first - 1])
+        self.__stat = fingerprint
+        self.__save()
+
+    def __save(self):
+        if not self.indexpath:
+            return
+        try:
+            with AtomicFile(self.indexpath, 'wb') as f:
+                f.write(marshal.dumps((self.indexversion(), self.__stat, self.encoding, self.entries)))
+        except (IOError, OSError) as e:
+            logwarning('Could not write the index of {}: {}'.format(self.path, e))
+
+    def lookup(self, key):
+        """Returns the value of a key, None if the file has no element with that key.
+        Only the element of the key is read and parsed.
+
+        Keyword Arguments:
+        key -- the key, normalized by the lookup"""
+        self.refresh()
+        entry = self.entries.get(LanguageElement.normalizekey(key))
+        if entry is None:
+            return None
+        with open(self.path, 'rb') as f:
+            f.seek(entry[0])
+            data = f.read(entry[1])
+        if PY3:
+            text = data.decode(self.encoding)
+        elif codecs.lookup(self.encoding).name == 'utf-8':
+            text = data
+        else:
+            text = data.decode(self.encoding).encode('utf-8')
+        for event in LanguageResource.cocoa_parselines(text.split('\n')):
+            if event[0] == 'element' and event[1]:
+                return event[2]
+        return None
+
+class SourceRecord:
+    """A file fed to a LanguageResource and what was parsed from it,
+    recorded when the resource tracks its sources (see LanguageResource.tracksources)"""
+
+    def __init__(self, path, kind, language, usecomments, filter=None, table=None, index=0):
+        """Keyword arguments:
+
+        path        -- the file path
+        kind        -- 'strings', 'android' or 'csv'
+        language    -- the language the file was fed with, None for csv files or if it was guessed
+        usecomments -- whether the comments of the file were used
+        filter      -- the language filter of a csv file
+        table       -- the table of the elements of a .strings file, None for the other files
+        index       -- the position of the file in the feeding order"""
+        self.path = path
+        self.kind = kind
+        self.language = language
+        self.usecomments = usecomments
+        self.filter = filter
+        self.table = table
+        self.index = index
+        # (mtime, size) of the file when it was fed, None if it did not exist
+        self.stat = self.filestat(path)
+        # the events parsed from the file (its rows for a csv file), merged again by 
+        # LanguageResource.refeed, None if it did not exist
+        self.events = None
+        # whether each value of the file not terminated by a ; was accepted, in order
+        self.decisions = []
+
+    @classmethod
+    def filestat(cls, path):
+        """Returns (mtime, size) of a file, or None if it does not exist"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_mtime, st.st_size)
+
+class ConflictReport:
+    """Collects the conflicts found while feeding a resource, i-e:
+      conflicts  -- the values that were not terminated by a ;, accepted or rejected
+      duplicates -- the values given several times for a key and a language"""
+
+    def __init__(self):
+        self.conflicts = []
+        self.duplicates = []
+
+    def __len__(self):
+        return len(self.conflicts) + len(self.duplicates)
+
+    def addconflict(self, source, key, language, value, accepted):
+        """Records a value that was not terminated by a ;"""
+        self.conflicts.append({ 'source' : source, 'key' : key, 'language' : language, 
+                                'value' : value, 'resolution' : 'accepted' if accepted else 'rejected' })
+
+    def addduplicate(self, source, key, language, kept, discarded, policy):
+        """Records a value given again for a key and a language"""
+        self.duplicates.append({ 'source' : source, 'key' : key, 'language' : language, 
+                                 'kept' : kept, 'discarded' : discarded, 'policy' : policy })
+
+    def report(self):
+        """Returns the conflicts as a dictionary"""
+        return { 'conflicts' : self.conflicts, 'duplicates' : self.duplicates }
+
+    def write(self, f):
+        """Writes the report as JSON to a file object"""
+        json.dump(self.report(), f, indent=2, sort_keys=True)
+        f.write('\n')
+
+class FormatValidator:
+    """Checks that the values of every language use the printf-style specifiers 
+    (e.g %@, %d or the positional %1$d) and the escape sequences (e.g \\n) of a reference language.
+
+    The signature of a value is the type of each argument it formats, by argument index,
+    and the number of each escape sequence. Signatures are cached by value, so that 
+    the values repeated across keys and languages are only scanned once.
+
+    The issues found are dictionaries with:
+      key, language -- the value checked
+      kind          -- 'missing', 'extra' or 'mismatch' for the arguments, 'escape' for the escape sequences
+      severity      -- 'error' for the arguments, 'warning' for the escape sequences
+      message       -- the description of the issue"""
+
+    # printf-style specifier: %[index$][flags][width][.precision][length]conversion
+    # the space flag is not supported, so that the "50 % de" of some languages is not a specifier
+    specifier_pattern = re.compile(r'%(?:(\d+)\$)?[-+#0\']*(\d+|\*)?(?:\.(\d+|\*))?(hh|h|ll|l|q|L|z|t|j)?([@diouxXDOUeEfFgGaAcCsSp%])')
+    escape_pattern = re.compile(r'\\[ntr]')
+    # conversions formatting the same type
+    conversions = { 'i' : 'd', 'D' : 'd', 'O' : 'o', 'U' : 'u', 'C' : 'c', 'S' : 's' }
+
+    def __init__(self):
+        # value -> signature
+        self.signatures = {}
+
+    def signature(self, value):
+        """Returns the ({argument index : specifier}, {escape sequence : count}) signature of a value"""
+        sig = self.signatures.get(value)
+        if sig is None:
+            arguments = {}
+            escapes = {}
+            if '%' in value:
+                position = 0
+                for match in self.specifier_pattern.finditer(value):
+                    (index, width, precision, length, conversion) = match.groups()
+                    if conversion == '%':
+                        continue
+                    # the * width and precision consume an argument
+                    for star in (width, precision):
+                        if star == '*':
+                            position += 1
+                            arguments[position] = '*'
+                    if index:
+                        index = int(index)
+                    else:
+                        position += 1
+                        index = position
+                    arguments[index] = '%' + (length or '') + self.conversions.get(conversion, conversion)
+            if '\\' in value:
+                for escape in self.escape_pattern.findall(value):
+                    escapes[escape] = escapes.get(escape, 0) + 1
+            sig = self.signatures[value] = (arguments, escapes)
+        return sig
+
+    def compare(self, reference, value):
+        """Returns the list of (kind, message) of the differences between the signatures of two values"""
+        (refarguments, refescapes) = self.signature(reference)
+        (arguments, escapes) = self.signature(value)
+        issues = []
+        if refarguments != arguments:
+            for (index, specifier) in sorted(refarguments.items()):
+                other = arguments.get(index)
+                if other is None:
+                    issues.append(('missing', 'argument {} ({}) is missing'.format(index, specifier)))
+                elif other != specifier:
+                    issues.append(('mismatch', 'argument {} is {} instead of {}'.format(index, other, specifier)))
+            for (index, specifier) in sorted(arguments.items()):
+                if not index in refarguments:
+                    issues.append(('extra', 'argument {} ({}) is not in the reference'.format(index, specifier)))
+        if refescapes != escapes:
+            for escape in sorted(set(refescapes) | set(escapes)):
+                (expected, count) = (refescapes.get(escape, 0), escapes.get(escape, 0))
+                if expected != count:
+                    issues.append(('escape', '{} {} instead of {}'.format(count, escape, expected)))
+        return issues
+
+    def validate(self, items, reference):
+        """Returns the list of the issues of values, see FormatValidator
+
+        Keyword arguments:
+        items     -- an iterable over the (key, {language : value}) of the elements
+        reference -- the reference language, the elements without reference value are not checked"""
+        issues = []
+        for (key, values) in items:
+            refvalue = values.get(reference)
+            if not refvalue:
+                continue
+            for (language, value) in sorted(values.items()):
+                if language == reference or not value:
+                    continue
+                for (kind, message) in self.compare(refvalue, value):
+                    issues.append({ 'key' : key, 'language' : language, 'kind' : kind, 
+                                    'severity' : 'warning' if kind == 'escape' else 'error', 'message' : message })
+        return issues
+
 class LanguageResource:
     """Represents the Language Resources.
     I-e several strings and several languages"""
 
-    def __init__(self):
+    # policies applied when a value is given again for a key and a language
+    duplicatepolicies = ('first-wins', 'last-wins')
+    # the table of the elements without table when cocoa files are written
+    defaulttable = 'Localizable'
+
+    def __init__(self, duplicatepolicy='first-wins', lazy=False, database=None, poolvalues=False):
+        """Keyword arguments:
+
+        duplicatepolicy -- 'first-wins' to keep the first value given for a key and a language,
+                           'last-wins' to keep the last one. Defaults to 'first-wins'
+        lazy            -- if True, feeding .lproj and values directories only lists their files,
+                           the files of a language being parsed when it is first needed (see loadlanguages).
+                           Until every language is loaded, the elements are the ones of the loaded languages,
+                           e.g writing a single language only writes its keys. Defaults to False
+        database        -- the path of a SQLite database storing the elements instead of the memory,
+                           for the resources that do not fit in memory. The resources already in the
+                           database are kept, see reset. Defaults to None i-e the memory
+        poolvalues      -- if True, identical values are stored once in memory whatever their
+                           language or table, for the resources repeating many values,
+                           see LanguageColumns. Defaults to False"""
+        if not duplicatepolicy in self.duplicatepolicies:
+            raise LangError('Invalid duplicate policy ' + str(duplicatepolicy))
+        self.duplicatepolicy = duplicatepolicy
+        self.lazy = lazy
+        self.poolvalues = poolvalues
+        # the (feed, table) not parsed yet in lazy mode, feed being (kind, autocorrect, jobs, cache)
+        self.__pending = []
+        self.database = database
+        self.__connection = SQLiteElementStore.connect(database) if database else None
+        # the ordered LanguageElement instances, also indexed by key,
+        # and the values of the elements
+        (self.elements, self.columns) = self.__newstores()
         # an array containing the languages
-        self.languages = []
-        # an array containing the LanguageElement instances
-        # it is repeated in keyedelements so that they can be accessed quickly
-        self.elements = []
-        self.keyedelements = {}
+        self.languages = self.elements.languages() if database else []
+        # the conflicts and duplicates found while feeding
+        self.conflicts = ConflictReport()
+        # the SourceRecord of every fed file by path, None if not tracked (see tracksources)
+        self.sources = None
+        # the (language, table) of the fed .strings files, written even without values
+        self.__stringstables = set()
 
     def reset(self):
         """Deletes all the resources"""
         self.languages = []
-        self.elements = []
-        self.keyedelements = {}
+        (self.elements, self.columns) = self.__newstores(clear=True)
+        self.conflicts = ConflictReport()
+        self.__pending = []
+        self.__stringstables = set()
+        if self.sources is not None:
+            self.sources = {}
+
+    def __newstores(self, clear=False):
+        """Returns the (element store, columns) of the resource, in its database if any
+
+        Keyword arguments:
+        clear -- if True, the database is emptied"""
+        if not self.__connection:
+            return (LanguageElementStore(), LanguageColumns(self.poolvalues))
+        columns = SQLiteColumns(self.__connection)
+        elements = SQLiteElementStore(self.__connection, columns)
+        if clear:
+            elements.clear()
+            elements.commit([])
+        return (elements, columns)
+
+    def __commit(self):
+        """Commits the changes of a feed to the database, if any"""
+        if self.__connection:
+            self.elements.commit(self.languages)
 
     # Convenience
 
     def getlanguages(self):
         return self.languages
 
+    def gettables(self):
+        """Returns the tables of the elements, in order. 
+        The elements without table (e.g fed from csv or android files) are in the defaulttable"""
+        if self.__pending:
+            self.loadlanguages()
+        return self.elements.tables(self.defaulttable)
+
     def getkeyedelement(self, key):
         """Returns the element corresponding to the provided key
 
         Keyword arguments:
         key -- the key"""
-        try:
-            return self.keyedelements[key]
-        except KeyError, IndexError:
-            return None
+        if self.__pending:
+            self.loadlanguages()
+        return self.elements.get(key)
 
     def getvalue(self, key, language):
         """Returns the value corresponding to the provided key and language
@@ -168,69 +2035,236 @@ class LanguageResource:
         Keyword arguments:
         key      -- the key
         language -- the language"""
-        try:
-            return self.keyedelements[key].getvalue(language)
-        except KeyError, IndexError:
-            return None
+        if self.__pending:
+            self.loadlanguages([language])
+        element = self.elements.get(key)
+        if element:
+            return element.getvalue(language)
+        return None
+
+    def missingcount(self, language):
+        """Returns the number of keys missing a value in a language
+
+        Keyword arguments:
+        language -- the language"""
+        if self.__pending:
+            self.loadlanguages()
+        return self.columns.missingcount(language)
+
+    def missingkeys(self, language):
+        """Returns the set of the keys missing a value in a language
+
+        Keyword arguments:
+        language -- the language"""
+        if self.__pending:
+            self.loadlanguages()
+        return self.columns.missingkeys(language)
+
+    def missingindex(self):
+        """Returns a dictionary of the number of keys missing a value, 
+        for each language missing values"""
+        if self.__pending:
+            self.loadlanguages()
+        missing = { l : self.columns.missingcount(l) for l in self.languages }
+        for k in list(missing):
+            if not missing[k]:
+                del missing[k]
+        return missing
+
+    def duplicatevalues(self, languages=None):
+        """Returns a dictionary of the keys sharing an identical value, by value and by language,
+        for the values of at least two keys, e.g to reuse translations
+
+        Keyword arguments:
+        languages -- the languages of the report, defaults to all"""
+        if self.__pending:
+            self.loadlanguages(languages)
+        duplicates = {}
+        for language in (languages or self.languages):
+            keys = self.columns.duplicatekeys(language)
+            if keys:
+                duplicates[language] = dict((value, sorted(shared)) for (value, shared) in keys.items())
+        return duplicates
 
     def missingvalues(self):
         """Returns the array of the elements that are missing values 
         in a language"""
-        missing = { l : [] for l in self.languages}
-        for k,v in self.keyedelements.iteritems():
-            for l in self.languages:
-                if not v.getvalue(l):
-                    missing[l].append(k)
-        #There might a more efficient way to cleanup?
-        for k in missing.keys():
-            if not missing[k]:
+        index = self.missingindex()
+        missing = { l : [] for l in self.languages }
+        for k in list(missing):
+            if not k in index:
                 del missing[k]
+        rows = { l : self.columns.missingrows(l) for l in missing }
+        if rows:
+            for e in self.elements.keyedelements():
+                for (l, r) in rows.items():
+                    if e.row in r:
+                        missing[l].append(e.key)
         return missing
 
+    def validate(self, reference=None, jobs=1):
+        """Checks the format specifiers and escape sequences of the values against the ones 
+        of a reference language, in a single pass over the elements (see FormatValidator).
+        Returns the list of the issues found, in the order of the elements.
+
+        Keyword arguments:
+        reference -- the reference language. Defaults to None, i-e en if it is a language, the first one otherwise
+        jobs      -- the number of processes checking the values, defaults to 1"""
+        if self.__pending:
+            self.loadlanguages()
+        if not self.languages:
+            return []
+        if reference is None:
+            reference = 'en' if 'en' in self.languages else self.languages[0]
+        elif not reference in self.languages:
+            raise LangError('Unknown reference language ' + reference)
+        items = [(e.key, e.values) for e in self.elements.keyedelements()]
+        if jobs > 1 and len(items) > 1:
+            size = (len(items) + jobs - 1) // jobs
+            pool = multiprocessing.Pool(jobs)
+            try:
+                results = pool.map(validateitems, [(items[i:i + size], reference) for i in xrange(0, len(items), size)])
+            finally:
+                pool.terminate()
+            return [issue for issues in results for issue in issues]
+        return FormatValidator().validate(items, reference)
+
+    def loadlanguages(self, languages=None):
+        """Parses the files of the provided languages that were only listed in lazy mode,
+        in the order they were fed. The elements being ordered as they are inserted,
+        loading the languages in another order than the feeding one may change it.
+        Returns the autocorrect value of the last feed.
+
+        Keyword arguments:
+        languages -- the languages to load, defaults to None i-e all of them"""
+        if languages is None:
+            (loading, self.__pending) = (self.__pending, [])
+        else:
+            loading = [p for p in self.__pending if p[1][1] in languages]
+            if not loading:
+                return None
+            self.__pending = [p for p in self.__pending if not p[1][1] in languages]
+        autocorrect = None
+        for (feed, pending) in itertools.groupby(loading, key=lambda p: p[0]):
+            (kind, autocorrect, jobs, cache) = feed
+            autocorrect = self.__loadtables([table for (_, table) in pending], kind, autocorrect, jobs, cache)
+        return autocorrect
+
     # Base construction
 
-    def __insertcomment(self, comment, index=None):
-        """ Inserts a comment, returns True if a new element was created
+    def __insertcomment(self, comment, after=None, table=None):
+        """ Inserts a comment, returns the created element
 
         Keyword arguments:
         comment -- a comment string
-        index   -- the index at which the comment should be inserted, defaults to end of elements array.
+        after   -- the element after which the comment should be inserted, defaults to the end of the elements.
+        table   -- the table of the comment, or None
         """
-        # This is probably not optimized
-        if index == None:
-            index = len(self.elements)
-        self.elements.insert(index, LanguageElement(comment=comment))
-        return index
+        return self.elements.insert(LanguageElement(comment=comment, table=table), after)
 
-    def __insertstring(self, key, string, comment, language, index=None):
-        """ Inserts a new string, returns True if a new element was created.
-        Raises a LangParseError if a value already exists for the corresponding key.
+    def __insertstring(self, key, string, comment, language, after=None, source=None, table=None):
+        """ Inserts a new string, returns the element holding it.
+        Raises a LangParseError if a value already exists for the corresponding key,
+        unless it is replaced according to the duplicate policy.
 
         Keyword arguments:
         key      -- the string key (str)
         string   --  a string (str)
         language -- the language
-        index    -- the desired position, if the key was already present, then it is ignored"""
-        # This is probably not optimized
-        if index == None:
-            index = len(self.elements)
-
-        key = LanguageElement.normalizekey(key)
-        element = self.getkeyedelement(key)
+        after    -- the element after which a new element is inserted, if the key was already present, then it is ignored
+        source   -- the file the string comes from, for the conflict report
+        table    -- the table of the element, set if it has none"""
+        key = self.__normalizekey(key)
+        element = self.elements.get(key)
         if element:
+            if table and not element.table:
+                self.elements.settable(element, table)
             if element.getvalue(language):
+                if self.__resolveduplicate(element, language, string, source):
+                    return element
                 raise LangParseError("Value already exists for key '{}' and language '{}'".format(key, language))
-            index = self.elements.index(element)
         else:
-            element = LanguageElement(key=key)
-            self.elements.insert(index, element)
-            self.keyedelements[key] = element
+            element = self.__insertkey(key, after, table)
         element.setvalue(language, string)
-        return index
+        return element
+
+    def __insertrow(self, key, values, after=None, source=None, table=None):
+        """ Inserts the values of a key in several languages at once, 
+        as __insertstring would for each language.
+        Returns the element holding them, or the position following the provided one
+        if a value already existed for every language.
 
-    def __constructelement(self, key, value, comment, language, usecomments = True, index=None):
+        Keyword arguments:
+        key    -- the string key (str)
+        values -- a list of (language, value)
+        after  -- the element after which a new element is inserted, if the key was already present, then it is ignored
+        source -- the file the row comes from, for the conflict report
+        table  -- the table of the element, set if it has none"""
+        key = self.__normalizekey(key)
+        element = self.elements.get(key)
+        if not element:
+            element = self.__insertkey(key, after, table)
+            for (language, value) in values:
+                element.setvalue(language, value)
+            return element
+        if table and not element.table:
+            self.elements.settable(element, table)
+        inserted = False
+        for (language, value) in values:
+            if element.getvalue(language):
+                if self.__resolveduplicate(element, language, value, source):
+                    inserted = True
+                elif value:
+                    logerror(LangParseError("Value already exists for key '{}' and language '{}'".format(key, language)))
+            else:
+                element.setvalue(language, value)
+                inserted = True
+        return element if inserted else self.elements.following(after)
+
+    def __resolveduplicate(self, element, language, value, source):
+        """Records a value given for a key and a language that already have one,
+        and replaces the existing value if the duplicate policy is 'last-wins'.
+        Empty or missing values are not duplicates, nothing is recorded for them.
+        Returns True if the value was replaced."""
+        if not value:
+            return False
+        existing = element.getvalue(language)
+        if self.duplicatepolicy == 'last-wins':
+            self.conflicts.addduplicate(source, element.key, language, value, existing, self.duplicatepolicy)
+            logwarning("Replacing value for key '{}' and language '{}'".format(element.key, language))
+            element.setvalue(language, value)
+            return True
+        self.conflicts.addduplicate(source, element.key, language, existing, value, self.duplicatepolicy)
+        return False
+
+    def __normalizekey(self, key):
+        """Returns the normalized key, see LanguageElement.normalizekey"""
+        if profiler:
+            start = time.time()
+            key = LanguageElement.normalizekey(key)
+            profiler.addtime('normalizekey', time.time() - start)
+            return key
+        return LanguageElement.normalizekey(key)
+
+    def __insertkey(self, key, after, table=None):
+        """Inserts and returns a new element for a normalized key"""
+        if profiler:
+            start = time.time()
+        key = intern(key)
+        element = self.elements.insert(LanguageElement(key=key, columns=self.columns, table=table), after)
+        if element.row is None:  # allocated by the store of a database
+            element.row = self.columns.newrow(key)
+        if profiler:
+            profiler.addtime('insert', time.time() - start)
+        return element
+
+    def __constructelement(self, key, value, comment, language, usecomments = True, after=None, source=None, table=None):
         """Constructs and inserts a string element
-        Returns the index of the inserted object
+        Returns the position of the inserted object
+
+        When nothing is inserted, the returned position is the one following
+        the provided one, so that elements are ordered exactly as they
+        were when positions were list indices.
 
         Keyword arguments:
         key         -- the key
@@ -238,44 +2272,168 @@ class LanguageResource:
         comment     -- a comment, can be None
         language    -- the language
         usecomments -- if false the comment is ignored, defaults to True
-        index       -- the preferred insertion index, defaults to None"""
+        after       -- the element after which it is inserted, defaults to None
+        source      -- the file the element comes from, for the conflict report
+        table       -- the table of the element, or None"""
         if key:
             try:
-                return self.__insertstring(key, value, (usecomments and comment) or '', language, index=index) 
+                return self.__insertstring(key, value, (usecomments and comment) or '', language, after=after, source=source, table=table)
             except LangParseError as e:
-                print(e)
-                return index
+                logerror(e)
+                return self.elements.following(after)
         elif usecomments and comment:
-            return self.__insertcomment(comment, index=index)
+            return self.__insertcomment(comment, after=after, table=table)
         else:
-            return index
-
-    def __constructelements(self, key, languagevaluedic, comment, usecomments = True, index = None):
-        """Constructs and inserts a string element given a value dictionary,
-        The element will contain the languages and values present in the 
-        provided language-value dictionary
-        Returns the index of the inserted object.
-        Used mostly when creating elements from a csv file.
-
-        Keyword arguments:
-        key              -- the keyindex
-        languagevaluedic -- a language-value dictionary containing all the values for the string
-        usecomments      -- if false the comment is ignored, defaults to True
-        index            -- the preferred insertion index, defaults to None"""
-        if key and languagevaluedic:
-            for l,v in languagevaluedic.iteritems():
-                # index won't change since we are adding values to the same key
-                index = self.__constructelement(key=key, value=v, comment=comment, language=l, usecomments=usecomments, index=index)
-                # deleting comment so that it is not added twice
-                comment = None
-                usecomments = None
-            return index
-        else:
-            return self.__constructelement(key=None, value=None, comment=comment, language=None, usecomments=usecomments, index=index)
+            return self.elements.following(after)
+
+    # Sources
+
+    def tracksources(self):
+        """Records what every file fed from now on contributes (see SourceRecord),
+        so that the files that changed can be fed again with refeed
+        instead of feeding everything again.
+        Raises a LangError if the resource is stored in a database."""
+        if self.__connection:
+            raise LangError('Sources cannot be tracked with a database')
+        if self.sources is None:
+            self.sources = {}
+
+    def __registersource(self, path, kind, language, usecomments, filter=None, table=None):
+        """Starts the record of a file about to be fed, if sources are tracked"""
+        if self.sources is not None:
+            self.sources[path] = SourceRecord(path, kind, language, usecomments, filter, table, len(self.sources))
+
+    def __recordevents(self, source, events):
+        """Keeps the events parsed from a tracked file, to merge them again with refeed"""
+        record = self.sources.get(source)
+        if record:
+            record.events = events
+
+    def __recordconflict(self, source, key, language, value, accepted):
+        """Reports a value not terminated by a ;, and records whether it was accepted if its file is tracked"""
+        self.conflicts.addconflict(source, key, language, value, accepted)
+        record = self.sources and self.sources.get(source)
+        if record:
+            record.decisions.append(accepted)
+
+    def changedsources(self):
+        """Returns the paths of the tracked files that were modified, created or deleted 
+        since they were fed, in feeding order. A file is considered modified when its
+        modification time or size changed."""
+        records = [r for r in self.sources.values() if SourceRecord.filestat(r.path) != r.stat]
+        return [r.path for r in sorted(records, key=lambda r: r.index)]
+
+    def refeed(self, paths, autocorrect=False):
+        """Feeds again tracked files, e.g the ones returned by changedsources.
+        Only these files are parsed again, but as a file can give its values and positions
+        to the keys of the files fed after it, every tracked file is merged again from the
+        events kept when it was parsed, in feeding order: the elements, their order and their
+        values are the ones a fresh feed of the files gives. The other files keep the resolutions 
+        of their values not terminated by a ;, and their logs are not shown again.
+        The deleted files are no longer merged, until they are created again.
+        Returns the set of the (language, table) whose written content changed, the table
+        being None for every table, e.g when the languages changed.
+        Raises a LangError, IOError, OSError or UnicodeError if a file cannot be fed, e.g while 
+        it is being saved: the resource and the records are then left as they were, so that the files 
+        are still returned by changedsources and can be fed again later.
+
+        Keyword arguments:
+        paths       -- the paths of the files
+        autocorrect -- see cocoa_feed, for the files fed again. Defaults to False"""
+        records = []
+        for path in paths:
+            if not path in self.sources:
+                raise LangError('File is not tracked: ' + path)
+            records.append(self.sources[path])
+        if self.__pending:
+            self.loadlanguages()
+        parsed = {}
+        for record in records:
+            stat = SourceRecord.filestat(record.path)
+            events = stat and self.__parsesource(record)
+            if events and record.kind == 'csv':
+                with quietlogs():  # the warnings are shown when the rows are merged
+                    self.__csv_parsefirstrow(events[0], record.filter, record.usecomments)
+            parsed[record.path] = (stat, events)
+        before = self.__contents()
+
+        state = (self.languages, self.elements, self.columns, self.conflicts, self.__stringstables)
+        sources = [(record, record.stat, record.events, record.decisions) for record in self.sources.values()]
+        self.languages = []
+        (self.elements, self.columns) = self.__newstores()
+        self.conflicts = ConflictReport()
+        self.__stringstables = set()
+        try:
+            for record in sorted(self.sources.values(), key=lambda r: r.index):
+                if record.path in parsed:
+                    (record.stat, record.events) = parsed[record.path]
+                    record.decisions = []
+                    if record.events is not None:
+                        autocorrect = self.__mergesource(record, autocorrect)
+                elif record.events is not None:
+                    (decisions, record.decisions) = (record.decisions, [])
+                    with quietlogs():
+                        self.__mergesource(record, None, iter(decisions))
+        except BaseException:  # e.g a csv file without any language
+            (self.languages, self.elements, self.columns, self.conflicts, self.__stringstables) = state
+            for (record, stat, events, decisions) in sources:
+                (record.stat, record.events, record.decisions) = (stat, events, decisions)
+            raise
+        return self.__changes(before)
+
+    @classmethod
+    def __parsesource(cls, record):
+        """Returns the events parsed from a tracked file, see SourceRecord"""
+        parse = { 'strings' : cls.cocoa_parsestrings, 'android' : cls.android_parsestrings, 'csv' : cls.csv_parserows }[record.kind]
+        return parse(record.path)
+
+    def __mergesource(self, record, autocorrect, decisions=None):
+        """Merges the events kept for a tracked file at the end of the resource, see refeed.
+        Returns autocorrect."""
+        if record.kind == 'csv':
+            self.__csv_feedrows(record.path, record.events, record.filter, record.usecomments)
+            return autocorrect
+        return self.__mergeevents(record.path, record.events, record.language, record.usecomments, autocorrect, 
+                                  kind=record.kind, table=record.table, decisions=decisions)
+
+    def __contents(self):
+        """Returns what the written files contain, to find what refeed changed: the languages,
+        the (table, key, comment) of the elements in order and their rows in the columns,
+        the columns, and the (language, table) of the fed .strings files"""
+        elements = list(self.elements)
+        return (list(self.languages), [(e.table or self.defaulttable, e.key, e.comment) for e in elements],
+                [e.row for e in elements], self.columns, set(self.__stringstables))
+
+    def __changes(self, before):
+        """Returns the (language, table) whose written content changed since __contents returned before"""
+        (languages, elements, rows, columns, stringstables) = before
+        (_, current, currentrows, _, _) = self.__contents()
+        if languages != self.languages:  # e.g the columns of csv files
+            return set((l, None) for l in set(languages) | set(self.languages))
+        changes = stringstables ^ self.__stringstables
+        if elements == current:
+            for language in self.languages:
+                (a, b) = (columns.columnvalues(language, rows), self.columns.columnvalues(language, currentrows))
+                if a != b:
+                    changes.update((language, e[0]) for (e, x, y) in izip(current, a, b) if x != y)
+            return changes
+        # the positions of the elements of each table
+        (old, new) = ({}, {})
+        for (tables, contents) in ((old, elements), (new, current)):
+            for (i, element) in enumerate(contents):
+                tables.setdefault(element[0], []).append(i)
+        moved = [t for t in set(old) | set(new) if [elements[i][1:] for i in old.get(t, ())] != [current[i][1:] for i in new.get(t, ())]]
+        # without any, only the order of the tables changed, e.g in csv files
+        changes.update((l, t) for l in self.languages for t in moved or [None])
+        for language in self.languages:
+            (a, b) = (columns.columnvalues(language, rows), self.columns.columnvalues(language, currentrows))
+            changes.update((language, t) for t in set(old).intersection(new).difference(moved)
+                           if [a[i] for i in old[t]] != [b[i] for i in new[t]])
+        return changes
 
     # Cocoa reading
 
-    def cocoa_feed(self, path, languages=None, tablename=None, usecomments=True, autocorrect=None):
+    def cocoa_feed(self, path, languages=None, tablename=None, usecomments=True, autocorrect=None, jobs=1, cache=None):
         """Creates all elements from a provided path, interpreting cocoa files.
         Path can be:
         - a directory containing .lproj directory
@@ -291,25 +2449,27 @@ class LanguageResource:
         usecomments -- if False the comments are ignored, defaults to True
         autocorrect -- if None the user will be prompted in conflicts, 
                        if True the conflicts will be autocorrected, 
-                       if False the conflicts will be ignored"""
+                       if False the conflicts will be ignored
+        jobs        -- the number of processes parsing the .strings files, defaults to 1
+        cache       -- a ParseCache storing the parsed files, defaults to None"""
         if os.path.isfile(path) and path.endswith('.strings'):
             language = None
             if languages:
                 language = languages[0]
                 if len(languages) > 1:
                     logwarning('Too many languages specified for .strings file. Only considering first one i-e ' + language)
-            self.cocoa_feedstrings(filepath=path, language=language, usecomments=usecomments, autocorrect=autocorrect)
+            self.cocoa_feedstrings(filepath=path, language=language, usecomments=usecomments, autocorrect=autocorrect, cache=cache)
         elif os.path.isdir(path) and path.endswith('.lproj'):
-            self.cocoa_feedlproj(path=path, tablename=tablename, usecomments=usecomments, autocorrect=autocorrect)
+            self.cocoa_feedlproj(path=path, tablename=tablename, usecomments=usecomments, autocorrect=autocorrect, jobs=jobs, cache=cache)
         elif os.path.isdir(path):
-            self.cocoa_feeddir(path=path, languages=languages, tablename=tablename, usecomments=usecomments, autocorrect=autocorrect)
+            self.cocoa_feeddir(path=path, languages=languages, tablename=tablename, usecomments=usecomments, autocorrect=autocorrect, jobs=jobs, cache=cache)
         else:
             raise LangError('Invalid path: ' + path)
 
-    def cocoa_feeddir(self, path, languages=None, tablename=None, usecomments=True, autocorrect=None):
+    def cocoa_feeddir(self, path, languages=None, tablename=None, usecomments=True, autocorrect=None, jobs=1, cache=None):
         """Creates all elements from a provided directory path, interpreting cocoa files.
         The directory must contain .lproj directories and not be a .lproj dir itself (see cocoa_feedlproj for that).
-        Calls cocoa_feedlproj with the right paths.
+        Feeds the .strings files of every .lproj directory, as cocoa_feedlproj would.
         Returns autocorrect (which can change depending on the user's response to prompts)
 
         Keyword arguments:
@@ -319,9 +2479,18 @@ class LanguageResource:
         usecomments -- if False the comments are ignored, defaults to True
         autocorrect -- if None the user will be prompted in conflicts, 
                        if True the conflicts will be autocorrected, 
-                       if False the conflicts will be ignored"""
+                       if False the conflicts will be ignored
+        jobs        -- the number of processes parsing the .strings files, defaults to 1
+        cache       -- a ParseCache storing the parsed files, defaults to None"""
         assert os.path.isdir(path) and not path.endswith('.lproj'), 'Incorrect dir path ' + path
 
+        with profilephase('scan'):
+            tables = self.__cocoa_dirtables(path, languages, tablename, usecomments)
+        return self.__feedtables(tables, 'strings', autocorrect, jobs, cache)
+
+    @classmethod
+    def __cocoa_dirtables(cls, path, languages, tablename, usecomments):
+        """Returns the tables to feed for a directory containing .lproj directories, see __cocoa_lprojtables"""
         if languages:
             dirs = list((os.path.join(path,p) for p in os.listdir(path) if p.endswith('.lproj') and p[:-6] in languages))
             if not dirs:
@@ -331,14 +2500,15 @@ class LanguageResource:
             if not dirs:
                 raise LangError('Directory {} did not contain any lproj dir'.format(path))
 
+        tables = []
         for lprojpath in dirs:
-            autocorrect = self.cocoa_feedlproj(path=lprojpath, tablename=tablename, usecomments=usecomments, autocorrect=autocorrect)
+            tables.extend(cls.__cocoa_lprojtables(lprojpath, tablename, usecomments))
             usecomments = False
-        return autocorrect
+        return tables
 
-    def cocoa_feedlproj(self, path, tablename=None, usecomments=True, autocorrect=None):
+    def cocoa_feedlproj(self, path, tablename=None, usecomments=True, autocorrect=None, jobs=1, cache=None):
         """Creates all elements from a provided .lproj directory path, interpreting cocoa files.
-        Calls cocoa_feedstrings with the right paths.
+        Feeds the .strings files of the directory, as cocoa_feedstrings would.
         Returns autocorrect (which can change depending on the user's response to prompts)
 
         Keyword arguments:
@@ -347,53 +2517,216 @@ class LanguageResource:
         usecomments -- if False the comments are ignored, defaults to True
         autocorrect -- if None the user will be prompted in conflicts, 
                        if True the conflicts will be autocorrected, 
-                       if False the conflicts will be ignored"""
+                       if False the conflicts will be ignored
+        jobs        -- the number of processes parsing the .strings files, defaults to 1
+        cache       -- a ParseCache storing the parsed files, defaults to None"""
+        with profilephase('scan'):
+            tables = self.__cocoa_lprojtables(path, tablename, usecomments)
+        return self.__feedtables(tables, 'strings', autocorrect, jobs, cache)
+
+    @classmethod
+    def __cocoa_lprojtables(cls, path, tablename, usecomments):
+        """Returns the list of (stringpath, language, usecomments, table) tables
+        to feed for a .lproj directory.
+
+        Keyword arguments:
+        path        -- the .lproj directory path
+        tablename   -- the table name, None for all tables
+        usecomments -- if False the comments are ignored"""
         assert path.endswith('.lproj') and os.path.isdir(path), 'Incorrect lproj path ' + path
         language = os.path.basename(path)[:-6]
         if tablename:
             stringpath = os.path.join(path, tablename + '.strings')
             if os.path.isfile(stringpath):
-                return self.cocoa_feedstrings(stringpath, language, usecomments, autocorrect)
+                return [(stringpath, language, usecomments, tablename)]
             else:
                 logwarning('File did not exist at path ' + stringpath)
-                return autocorrect
+                return []
         else:
             files = (os.path.join(path,p) for p in os.listdir(path) if p.endswith('.strings'))
-            for stringpath in files:
-                if usecomments:
-                    self.__insertcomment('======================\nTable : ' + os.path.basename(stringpath)[:-8] + '\n======================')
-                autocorrect = self.cocoa_feedstrings(stringpath, language, usecomments, autocorrect)
+            return [(stringpath, language, usecomments, cls.cocoa_tablename(stringpath)) for stringpath in files]
+
+    def __feedtables(self, tables, kind, autocorrect, jobs, cache):
+        """Parses the provided tables and merges them in order, see __loadtables.
+        In lazy mode, their languages are only added and the tables are loaded by loadlanguages.
+        Returns autocorrect."""
+        if not self.lazy:
+            return self.__loadtables(tables, kind, autocorrect, jobs, cache)
+        feed = (kind, autocorrect, jobs, cache)
+        for table in tables:
+            if not table[1] in self.languages:
+                self.languages.append(table[1])
+            self.__pending.append((feed, table))
+        return autocorrect
 
-            return autocorrect
+    def __loadtables(self, tables, kind, autocorrect, jobs, cache):
+        """Parses the provided tables and merges them in order.
+        When jobs is greater than 1, the files are parsed by a pool of processes,
+        the merge (and therefore the prompts and warnings) still happening in order.
+        Returns autocorrect.
+
+        Keyword arguments:
+        tables      -- a list of (stringpath, language, usecomments, table), see __cocoa_lprojtables
+        kind        -- 'strings' for cocoa files, 'android' for android files
+        autocorrect -- see cocoa_feed
+        jobs        -- the number of processes
+        cache       -- a ParseCache, or None"""
+        parse = { 'strings' : cocoa_parsestringsfile, 'android' : android_parsestringsfile }[kind]
+        paths = [t[0] for t in tables]
+        for (stringpath, language, usecomments, table) in tables:
+            self.__registersource(stringpath, kind, language, usecomments, table=table)
+        pool = None
+        mapfunction = imap
+        if jobs > 1 and len(paths) > 1:
+            pool = multiprocessing.Pool(min(jobs, len(paths)))
+            mapfunction = pool.imap
+        if cache:
+            results = cache.map(kind, parse, paths, mapfunction)
+        else:
+            results = iter(mapfunction(parse, paths))
+
+        try:
+            for (stringpath, language, usecomments, table) in tables:
+                parseseconds = None
+                if profiler:
+                    start = time.time()
+                    events = next(results)
+                    parseseconds = time.time() - start
+                    profiler.addtime('parse', parseseconds)
+                else:
+                    events = next(results)
+                autocorrect = self.__mergeevents(stringpath, events, language, usecomments, autocorrect, parseseconds, kind, table=table)
+        finally:
+            if pool:
+                pool.terminate()
+        return autocorrect
+
+    # a quoted string, the quotes escaped with a backslash not ending it, stored in two groups (one per quote)
+    cocoa_quoted = r'"([^"\\]*(?:\\.[^"\\]*)*)"|\'([^\'\\]*(?:\\.[^\'\\]*)*)\''
+    # a stripped line of a strings file, scanned once from left to right
+    # groups are :
+    #   the key, in 1 or 2
+    #   the value, in 3 or 4 (or the value without key, in 1 or 2)
+    #   ; (or None)
+    #   // <comment> or /* <comment> (or None)
+    cocoa_line_pattern = re.compile(r'''(?:(?:{0})[ \t\n\r\f\v]*
+                                        (?:=[ \t\n\r\f\v]*(?:{0})[ \t\n\r\f\v]*)?)?
+                                     (;)?[ \t\n\r\f\v;]*
+                                     ([/*|].*)?\Z'''.format(cocoa_quoted), re.VERBOSE | re.DOTALL)
 
     @classmethod
-    def cocoa_getlinepattern(cls):
-        # regex to parse a line of a strings file
-        # groups are :
-        #   key (<key> or None)
-        #   value (<value> or None)
-        #   sc (; or None)
-        #   com (// <comment> or /* <comment> or None)
-        return re.compile(r'''  (?: # Beginning of key/value block or value block
-                                    (?: # Beginning of key block
-                                        ((?<![\\])[\'"])                    # unescaped quote or single quote and stores it in 1
-                                        (?P<key>(?:.(?!(?<![\\])\1))*.?)    # key
-                                        \1                                  # quote found in 1
-                                        \s*?=\s*?
-                                    )?  # End of key block
-                                    ((?<![\\])[\'"])                      # same as before but stored in 3
-                                    (?P<val>(?:.(?!(?<![\\])\3))*.?)      # value
-                                    \3
-                                )?  # End of key/value block or value block
-                                \s*?
-                                (?P<sc>;{1})?                               # semicolon?
-                                [\s|;]*?
-                                (?:(?P<com>[//|/*].*))?
-                                $'''          # comment?
-                                ,re.VERBOSE)
-
-    def cocoa_feedstrings(self, filepath, language=None, usecomments=True, autocorrect=None):
+    def cocoa_tokenizeline(cls, line):
+        """Splits a stripped line of a strings file with a single scan, see cocoa_line_pattern.
+        Returns None if the line could not be parsed, or (key, value, semicolon, comment) with:
+          key       -- <key> or None
+          value     -- <value> or None, escaped characters are left untouched
+          semicolon -- True if a ; followed the value
+          comment   -- // <comment> or /* <comment> or None
+
+        Keyword arguments:
+        line -- the stripped line"""
+        match = cls.cocoa_line_pattern.match(line)
+        if not match:
+            return None
+        (key, singlekey, value, singlevalue, semicolon, comment) = match.groups()
+        if key is None:
+            key = singlekey
+        if value is None:
+            value = singlevalue
+        if value is None:  # a value without key
+            (key, value) = (None, key)
+        return (key, value, semicolon is not None, comment)
+
+    def cocoa_feedstrings(self, filepath, language=None, usecomments=True, autocorrect=None, cache=None):
         """Parses a cocoa .strings file and stores its values
+        See cocoa_parsestrings for the supported schemes.
+
+        Returns autocorrect.
+
+        Keyword arguments:
+        filepath -- the .strings file path
+        language -- the language associated with the file
+        cache    -- a ParseCache storing the parsed file, defaults to None
+        """
+        parseseconds = None
+        table = self.cocoa_tablename(filepath)
+        self.__registersource(filepath, 'strings', language, usecomments, table=table)
+        if profiler:
+            start = time.time()
+        if cache:
+            events = cache.get(filepath, 'strings', self.cocoa_parsestrings)
+        else:
+            events = self.cocoa_parsestrings(filepath)
+        if profiler:
+            parseseconds = time.time() - start
+            profiler.addtime('parse', parseseconds)
+        return self.__mergeevents(filepath, events, language, usecomments, autocorrect, parseseconds, table=table)
+
+    @classmethod
+    def cocoa_tablename(cls, filepath):
+        """Returns the table of a .strings file, i-e its name without extension"""
+        return os.path.splitext(os.path.basename(filepath))[0]
+
+    @classmethod
+    def cocoa_indexes(cls, path, languages=None, tablename=None, cache=None):
+        """Returns the list of (language, table, StringsIndex) of the .strings files of a path, 
+        the default table first for each language, without feeding them.
+        Path can be a directory containing .lproj directories, a .lproj directory or a .strings file 
+        (in which case the language is the first provided one, or the one of its .lproj directory).
+
+        Keyword arguments:
+        path      -- the path
+        languages -- if provided, restricts the .lproj directories that are considered
+        tablename -- the table name (e.g Localizable in Localizable.strings). Defaults to None, i-e all tables
+        cache     -- a ParseCache storing the indexes, defaults to None i-e they are built but not stored"""
+        if os.path.isfile(path) and path.endswith('.strings'):
+            if languages:
+                language = languages[0]
+            else:
+                language = os.path.basename(os.path.dirname(os.path.abspath(path)))
+                if not language.endswith('.lproj'):
+                    raise LangError("Language was not provided")
+                language = language[:-6]
+            tables = [(path, language, False, cls.cocoa_tablename(path))]
+        elif os.path.isdir(path) and path.endswith('.lproj'):
+            tables = cls.__cocoa_lprojtables(path, tablename, False)
+        elif os.path.isdir(path):
+            tables = cls.__cocoa_dirtables(path, languages, tablename, False)
+        else:
+            raise LangError('Invalid path: ' + path)
+        tables.sort(key=lambda t: (t[1], t[3] != cls.defaulttable, t[3]))
+        return [(language, table, StringsIndex(stringpath, cache and cache.indexpath(stringpath))) 
+                for (stringpath, language, _, table) in tables]
+
+    @classmethod
+    def cocoa_lookup(cls, path, keys, languages=None, tablename=None, cache=None):
+        """Returns the values of a few keys read from the .strings files of a path through their 
+        indexes (see cocoa_indexes), as a dictionary key -> language -> value.
+        The value of a language is the one of its first table containing the key, see cocoa_indexes.
+
+        Keyword arguments:
+        path      -- the path, see cocoa_indexes
+        keys      -- the keys
+        languages -- if provided, restricts the .lproj directories that are considered
+        tablename -- the table name. Defaults to None, i-e all tables
+        cache     -- a ParseCache storing the indexes, defaults to None"""
+        values = dict((key, {}) for key in keys)
+        for (language, table, index) in cls.cocoa_indexes(path, languages, tablename, cache):
+            for key in keys:
+                if not language in values[key]:
+                    value = index.lookup(key)
+                    if value is not None:
+                        values[key][language] = value
+        return values
+
+    @classmethod
+    def cocoa_parsestrings(cls, filepath):
+        """Parses a cocoa .strings file without storing anything.
+        Returns the list of events found in the file, in order, with:
+          ('element', key, value, comment)  -- an element to construct, key and comment can be empty
+          ('conflict', key, value, comment) -- an element that was not terminated by a ;
+          ('warning', message)              -- a parse warning
+          ('lines', count)                  -- the number of lines of the file, always last
 
         Only supported schemes are (ignoring white spaces):
 
@@ -413,11 +2746,136 @@ class LanguageResource:
 
         // Comment
 
+        Keyword arguments:
+        filepath -- the .strings file path, encoded in utf-8 or utf-16 (see detectencoding)
+        """
+        with maptext(filepath) as f:
+            return cls.cocoa_parselines(f)
+
+    @classmethod
+    def cocoa_parselines(cls, lines, spans=None):
+        """Parses the lines of a cocoa .strings file, see cocoa_parsestrings.
+        Returns the list of events.
+
+        Keyword arguments:
+        lines -- an iterable over the lines
+        spans -- if provided, a list to which (key, first line, last line) is appended 
+                 for every element event with a key, the lines being numbered from 1
+        """
+        events = []
+
+
+        # Initializing variables
+        # the comment is kept as a list of fragments, joined when the element is constructed
+        (key, value, comment, multilinecomment, consume) = ('', '', [], False, False)
+        (tempkey, tempvalue, tempcomment, tempterm) = (None, None, None, False)
+        index = -1
+        linecount = 0
+        keyline = 0
+
+        for line in lines:
+            linecount += 1
+            # construct element and reset
+            if consume: 
+                events.append(('element', key, value, ''.join(comment)))
+                if spans is not None and key:
+                    spans.append((key, keyline, linecount - 1))
+                (key, value, comment, multilinecomment, consume) = ('', '', [], False, False)
+
+            # Ignoring empty lines
+            line = line.strip()
+            if not line:  
+                continue
+
+            # Handling multiline comments
+            if multilinecomment:
+                index = line.find('*/')
+                if index >= 0: #end of multiline comment, boolean reset at beginning of loop
+                    if index > 0:
+                        comment.extend(('\n', line[:index]))
+                    consume = True
+                    if len(line) > index + 2:
+                        events.append(('warning', 'Ignoring line after "*/": "{}"'.format(line[index+2:])))
+                else:
+                    comment.extend(('\n', line))
+                continue
+
+            tokens = cls.cocoa_tokenizeline(line)
+            if tokens:
+                (tempkey, tempvalue, tempterm, tempcomment) = tokens
+
+                # Handling value and key
+                if tempkey:  # Expecting value
+
+                    # Checking for conflict
+                    if key:  
+                        events.append(('conflict', key, value, ''.join(comment)))
+                        (key, value, comment, multilinecomment, consume) = ('', '', [], False, False)
+
+                    if tempvalue == None:
+                        events.append(('warning', 'ignoring line because it had a key but not a value:\n    {}'.format(line)))
+                        continue
+                    else:
+                        (key, value, consume) = (tempkey, tempvalue, tempterm)
+                        consume = tempterm  # Consuming only if ; was present 
+                        keyline = linecount
+                else:
+                    if tempvalue != None:
+                        if key:
+                            value += tempvalue
+                            consume = tempterm
+                        else:
+                            events.append(('warning', 'ignoring line because it had a value but no key was set:\n    {}'.format(line)))
+                            continue
+
+                # Handling comment
+                if tempcomment: # Ignoring empty comments
+                    # Checking if comment is multiline
+                    if tempcomment.startswith('/*'):
+                        index = tempcomment.find('*/')
+                        if index >= 0:
+                            tempcomment = tempcomment[:index]
+                        else:
+                            multilinecomment = True
+                    else: # Single line comment
+                        if not ( key or value ):
+                            consume = True
+                    # Removing first comment char
+                    if comment:
+                        comment.extend(('; ', tempcomment[2:].strip()))
+                    elif tempcomment[2:].strip():
+                        comment.append(tempcomment[2:].strip())
+
+            else:
+                events.append(('warning', 'ignoring line because it could not be parsed:\n    {}'.format(line)))
+                continue
+
+        # Dealing with last line
+        if consume:
+            events.append(('element', key, value, ''.join(comment)))
+            if spans is not None and key:
+                spans.append((key, keyline, linecount))
+        elif key and value:
+            events.append(('conflict', key, value, ''.join(comment)))
+
+        events.append(('lines', linecount))
+        return events
+
+    def __mergeevents(self, filepath, events, language, usecomments, autocorrect, parseseconds=None, kind='strings', table=None, decisions=None):
+        """Stores the events parsed from a .strings or android file (see cocoa_parsestrings)
+        The comments introducing a table (see LanguageElement.bannercomment) are not stored,
+        the following elements belonging to that table.
         Returns autocorrect.
 
         Keyword arguments:
-        filepath -- the .strings file path
-        language -- the language associated with the file
+        filepath     -- the parsed file path
+        events       -- the parsed events
+        language     -- the language associated with the file
+        parseseconds -- the parse duration, recorded if a profiler is set
+        kind         -- 'strings' for cocoa files, 'android' for android files
+        table        -- the table of the elements, None for android files
+        decisions    -- an iterator over whether each value not terminated by a ; is accepted,
+                        instead of autocorrect, e.g when a file is merged again. Defaults to None
         """
         try:
             if usecomments and not language is self.languages[0]:
@@ -434,102 +2892,52 @@ class LanguageResource:
             else:
                 raise LangError("Language was not provided")
 
-        cocoa_pattern = self.cocoa_getlinepattern()
-
-        with open(filepath, 'r') as f:
-
-            if not language in self.languages:
-                self.languages.append(language)
-
-            # Initializing variables
-            (key, value, comment, multilinecomment, consume) = ('', '', '', False, False)
-            (tempkey, tempvalue, tempcomment, tempterm) = (None, None, None, False)
-            index = -1
-            lastinsertindex = len(self.elements)-1
-
-            for line in f:
-                # construct element and reset
-                if consume: 
-                    lastinsertindex = self.__constructelement(key, value, comment, language, usecomments, lastinsertindex+1)
-                    (key, value, comment, multilinecomment, consume) = ('', '', '', False, False)
-
-                # Ignoring empty lines
-                line = line.strip()
-                if not line:  
-                    continue
-
-                # Handling multiline comments
-                if multilinecomment:
-                    index = line.find('*/')
-                    if index >= 0: #end of multiline comment, boolean reset at beginning of loop
-                        comment += ((index > 0 and '\n') or '') + line[:index]
-                        consume = True
-                        if len(line) > index + 2:
-                            logwarning('Ignoring line after "*/": "{}"'.format(line[index+2:]))
-                    else:
-                        comment += '\n' + line
-                    continue
-
-                # Using regex
-                m = cocoa_pattern.match(line)
-                if m:
-                    (tempkey, tempvalue, tempcomment, tempterm) = ( m.group('key'), m.group('val'), m.group('com'), m.group('sc')!=None )
-
-                    # Handling value and key
-                    if tempkey:  # Expecting value
-
-                        # Checking for conflict
-                        if key:  
-                            (autocorrect, lastinsertindex) = self.__cocoa_handlecorrection(key, value, comment, language, usecomments, autocorrect, lastinsertindex+1)
-                            (key, value, comment, multilinecomment, consume) = ('', '', '', False, False)
-
-                        if tempvalue == None:
-                            logwarning('ignoring line because it had a key but not a value:\n    {}'.format(line))
-                            continue
-                        else:
-                            (key, value, consume) = (tempkey, tempvalue, tempterm)
-                            consume = tempterm  # Consuming only if ; was present 
-                    else:
-                        if tempvalue != None:
-                            if key:
-                                value += tempvalue
-                                consume = tempterm
-                            else:
-                                logwarning('ignoring line because it had a value but no key was set:\n    {}'.format(line))
-                                continue
-
-                    # Handling comment
-                    if tempcomment: # Ignoring empty comments
-                        # Checking if comment is multiline
-                        if tempcomment.startswith('/*'):
-                            index = tempcomment.find('*/')
-                            if index >= 0:
-                                tempcomment = tempcomment[:index]
-                            else:
-                                multilinecomment = True
-                        else: # Single line comment
-                            if not ( key or value ):
-                                consume = True
-                        # Removing first comment char
-                        if comment:
-                            comment += '; ' + tempcomment[2:].strip()
-                        else:
-                            comment = tempcomment[2:].strip()
-
+        if not language in self.languages:
+            self.languages.append(language)
+        if self.sources:
+            self.__recordevents(filepath, events)
+        if kind == 'strings':
+            self.__stringstables.add((language, table or self.defaulttable))
+
+        if profiler:
+            start = time.time()
+        lastinsert = self.elements.last()
+        for event in events:
+            if event[0] == 'element':
+                if not event[1]:
+                    banner = LanguageElement.bannertable(event[3])
+                    if banner:
+                        table = banner
+                        continue
+                lastinsert = self.__constructelement(event[1], event[2], event[3], language, usecomments, lastinsert, filepath, table)
+            elif event[0] == 'conflict':
+                if decisions is None:
+                    (autocorrect, lastinsert) = self.__cocoa_handlecorrection(event[1], event[2], event[3], language, usecomments, autocorrect, lastinsert, filepath, table)
                 else:
-                    logwarning('ignoring line because regex did not match:\n    {}'.format(line))
-                    continue
-
-            # Dealing with last line
-            if consume:
-                self.__constructelement(key, value, comment, language, usecomments, lastinsertindex+1)
-            elif key and value:
-                (autocorrect, lastinsertindex) = self.__cocoa_handlecorrection(key, value, comment, language, usecomments, autocorrect, lastinsertindex+1)
-
+                    (_, lastinsert) = self.__cocoa_handlecorrection(event[1], event[2], event[3], language, usecomments, next(decisions), lastinsert, filepath, table)
+            elif event[0] == 'warning':
+                logwarning(event[1])
+        self.__commit()
+
+        if profiler:
+            duration = time.time() - start
+            profiler.addtime('merge', duration)
+            kinds = [event[0] for event in events]
+            profiler.addfile(filepath, 'android_feed' if kind == 'android' else 'cocoa_feed', language=language,
+                             bytes=os.path.getsize(filepath),
+                             lines=events[-1][1] if kinds and kinds[-1] == 'lines' else None,
+                             matches=kinds.count('element'), conflicts=kinds.count('conflict'),
+                             fallbacks=kinds.count('warning'), parse_seconds=parseseconds, merge_seconds=duration)
         return autocorrect
 
-    def __cocoa_handlecorrection(self, key, value, comment, language, usecomments, autocorrect, index):
-        """Returns (autocorrect, insertindex)"""
+    def __cocoa_handlecorrection(self, key, value, comment, language, usecomments, autocorrect, after, source=None, table=None):
+        """Resolves a value that was not terminated by a ;
+        If autocorrect is None, the user is prompted, 
+        if True the value is added, if False it is ignored.
+        Returns (autocorrect, lastinsert)"""
+        if autocorrect == False:
+            self.__recordconflict(source, key, language, value, False)
+            return (False, self.elements.following(after))
         if autocorrect == None:
             i = raw_input('Cocoa parse error (You probably forgot a ;):\n'\
                           '    key = "{}"\n'\
@@ -543,75 +2951,343 @@ class LanguageResource:
             if i == 'ya':
                 autocorrect = True
             elif i == 'na':
-                return (False, index)
+                self.__recordconflict(source, key, language, value, False)
+                return (False, self.elements.following(after))
             elif i == 'n':
-                return (None, index)
+                self.__recordconflict(source, key, language, value, False)
+                return (None, self.elements.following(after))
 
         # Resolving
+        self.__recordconflict(source, key, language, value, True)
         logwarning('adding from parse error key = {}, value = {}'.format(key, value))
-        index = self.__constructelement(key, value, comment, language, usecomments, index)
+        lastinsert = self.__constructelement(key, value, comment, language, usecomments, after, source, table)
 
-        return (autocorrect, index)
+        return (autocorrect, lastinsert)
 
     # Cocoa writing
 
-    def __cocoa_string(self, language, pretty = False):
-        """Returns the corresponding cocoa string
-        """
-        s = "\n".join((item.cocoa_line(language) for item in self.elements))
-        if pretty:
-            s = re.sub('$\s*?(?=/)','\n\n',s,flags=re.MULTILINE)
-        return s
+    # size of the buffer used when writing files
+    write_buffersize = 1 << 16
 
-    def cocoa_write(self, languages=None, path='.', overwrite=False, tablename='Localizable', pretty = False):
-        """Writes the resources in the corresponding lproj directories
-        e.g with the default arguments, the en file will be written to en.lproj/Localizable.strings
+    def cocoa_writestrings(self, f, language, pretty = False, tablename=None):
+        """Writes the cocoa strings of a language to a file object, one element at a time
+
+        Keyword Arguments:
+        f         -- the file object
+        language  -- the language
+        pretty    -- if True, comments are preceded by a blank line
+        tablename -- the table written, see gettables. Defaults to None, i-e every table, 
+                     each one being introduced by a comment (see LanguageElement.bannercomment)"""
+        if self.__pending:
+            self.loadlanguages([language])
+        writer = CocoaStringsWriter(f, language, pretty)
+        if tablename:
+            default = tablename == self.defaulttable
+            for element in self.elements.languageelements(language):
+                if element.table == tablename or (default and not element.table):
+                    writer.writeelement(element)
+        else:
+            for element in self.__withbanners(self.elements.languageelements(language), language):
+                writer.writeelement(element)
+        writer.close()
+
+    def cocoa_write(self, languages=None, path='.', overwrite=False, tablename=None, pretty = False, jobs=1, skipunchanged=False, encoding='utf-8'):
+        """Writes the resources in the corresponding lproj directories, a file per table
+        e.g with the default arguments, the en elements of the Localizable table will be written to en.lproj/Localizable.strings
+        A table is only written for the languages having a value in it or a fed .strings file of it.
+        Each file is written to a temporary file first, and then renamed, 
+        so that an interrupted write never leaves a partial file.
+        Returns the list of the paths that were skipped because they were unchanged.
 
         Keyword Arguments:
         languages --  the chosen languages. If none is provided, all languages are created. Defaults to None.
         path -- the directory in which the .lproj directories will be written. Defaults to '.'
-        tablename -- the tableName, i-e the name of the strings file. Defaults to 'Localizable'
+        tablename -- the table written, i-e the name of the strings file, see gettables. 
+                     Defaults to None, i-e every table
+        jobs -- the number of threads writing the files concurrently. Defaults to 1
+        skipunchanged -- if True, existing files with the same content are not rewritten. Defaults to False
+        encoding -- the encoding of the files, e.g 'utf-8' or 'utf-16'. Defaults to 'utf-8'
         """
         if os.path.exists(path) and not os.path.isdir(path):
             raise LangError('Output path {} is not a directory'.format(path))
 
         if not languages:
             languages = self.languages
-        
-        if len(languages)>1:
-            for l in self.languages:
-                self.cocoa_write([l], path, overwrite, tablename, pretty)
-        else:
-            language = languages[0]
+        if self.__pending:
+            self.loadlanguages(languages)
+
+        tables = self.elements.tables(self.defaulttable)  # of the loaded languages in lazy mode
+        if tablename:
+            if not tablename in tables:
+                raise LangError('Unknown table ' + tablename)
+            tables = [tablename]
+        outputs = []
+        for language in languages:
             dirpath = os.path.join(path,language + os.path.extsep + "lproj")
-            if not os.path.exists(dirpath):
+            # the tables without value in the language are only written if a file had them,
+            # an empty value overriding e.g the one of the Info.plist for InfoPlist.strings
+            valued = self.elements.tables(self.defaulttable, language)
+            for table in tables:
+                if not table in valued and not (language, table) in self.__stringstables:
+                    continue
+                outputpath = os.path.join(dirpath, table + os.path.extsep + "strings")
+                if os.path.exists(outputpath) and not overwrite:
+                    raise LangError('File already exists at path %s' % outputpath)
+                outputs.append((language, outputpath, table))
+
+        return self.__writefiles(outputs, 'cocoa', lambda f, language, table: self.cocoa_writestrings(f, language, pretty, table), jobs, skipunchanged, encoding)
+
+    def __withbanners(self, elements, language=None):
+        """Returns a generator over elements, the ones of a table being preceded by
+        a comment introducing it (see LanguageElement.bannercomment), for the files without tables
+
+        Keyword Arguments:
+        elements -- the elements
+        language -- if provided, only the tables in which the language has a value are introduced,
+                    as cocoa_write only writes those. Defaults to None, i-e every table"""
+        tables = None
+        if language:
+            tables = set(self.elements.tables(self.defaulttable, language))
+        table = None
+        for element in elements:
+            if element.table and element.table != table:  # the elements without table do not end a table
+                table = element.table
+                if tables is None or table in tables:
+                    yield LanguageElement(comment=LanguageElement.bannercomment(table))
+            yield element
+
+    def __writefiles(self, outputs, kind, write, jobs, skipunchanged, encoding='utf-8'):
+        """Writes a file per language, concurrently if jobs is greater than 1
+        Returns the list of the paths that were skipped because they were unchanged.
+
+        Keyword Arguments:
+        outputs       -- a list of (language, outputpath, table), table being None for android files
+        kind          -- 'cocoa' or 'android', for logs
+        write         -- the function writing a language to a file object, write(f, language, table)
+        jobs          -- the number of threads
+        skipunchanged -- if True, existing files with the same content are not rewritten
+        encoding      -- the encoding of the files. Defaults to 'utf-8'"""
+        skipped = []
+        if self.__connection:  # the connection is not shared between threads
+            jobs = 1
+        if jobs > 1 and len(outputs) > 1:
+            pool = multiprocessing.pool.ThreadPool(min(jobs, len(outputs)))
+            try:
+                for (language, outputpath, table) in outputs:
+                    loginfo('Writing {} file at path {}'.format(kind, outputpath))
+                results = pool.map(lambda output: self.__writefile(output[1], output[0], output[2], write, skipunchanged, encoding), outputs)
+            finally:
+                pool.terminate()
+            for ((language, outputpath, table), (changed, duration)) in zip(outputs, results):
+                self.__profilewrite(kind, outputpath, language, changed, duration)
+                if changed:
+                    loginfo('Wrote {} in {:.3f}s'.format(outputpath, duration))
+                else:
+                    loginfo('Skipped unchanged {} in {:.3f}s'.format(outputpath, duration))
+                    skipped.append(outputpath)
+        else:
+            for (language, outputpath, table) in outputs:
+                loginfo('Writing {} file at path {}'.format(kind, outputpath))
+                (changed, duration) = self.__writefile(outputpath, language, table, write, skipunchanged, encoding)
+                self.__profilewrite(kind, outputpath, language, changed, duration)
+                if not changed:
+                    loginfo('Skipped unchanged file at path '+outputpath)
+                    skipped.append(outputpath)
+        return skipped
+
+    @classmethod
+    def __profilewrite(cls, kind, outputpath, language, changed, duration):
+        """Records a written file if a profiler is set"""
+        if profiler:
+            profiler.addtime(kind + '_write', duration)
+            profiler.addfile(outputpath, kind + '_write', language=language, changed=changed, 
+                             bytes=os.path.getsize(outputpath), seconds=duration)
+
+    def __writefile(self, outputpath, language, table, write, skipunchanged, encoding):
+        """Writes the file of a language atomically
+        Returns (changed, duration), changed being False if the file was left untouched"""
+        start = time.time()
+        dirpath = os.path.dirname(outputpath)
+        if not os.path.exists(dirpath):
+            try:
                 os.makedirs(dirpath)
-            outputpath = os.path.join(dirpath, tablename + os.path.extsep + "strings")
+            except OSError:  # created in the meantime by another thread
+                if not os.path.isdir(dirpath):
+                    raise
+        with AtomicFile(outputpath, 'w', self.write_buffersize, skipunchanged, encoding) as f:
+            write(f, language, table)
+        return (f.changed, time.time() - start)
+
+    # Android reading
+
+    # the language of a values directory, 'Base' for the default values
+    android_values_pattern = re.compile(r'values(?:-([a-z]{2,3}(?:-r[A-Z]{2})?|b\+[\w+]+))?\Z')
+
+    @classmethod
+    def android_language(cls, dirname):
+        """Returns the language of a values directory name, or None if it is not one
+        e.g 'values-fr' -> 'fr', 'values' -> 'Base', 'values-land' -> None"""
+        match = cls.android_values_pattern.match(dirname)
+        if not match:
+            return None
+        return match.group(1) or 'Base'
+
+    @classmethod
+    def android_directory(cls, language):
+        """Returns the values directory name of a language, see android_language"""
+        if language == 'Base':
+            return 'values'
+        return 'values-' + language
+
+    def android_feed(self, path, languages=None, filename='strings.xml', usecomments=True, jobs=1, cache=None):
+        """Creates all elements from a provided path, interpreting android files.
+        Path can be:
+        - a res directory containing values directories, e.g values-fr
+        - a values directory
+        - an xml file (the language is the one of its directory if the languages argument is not provided)
+        The values directory without qualifier is read as the 'Base' language.
+
+        Keyword arguments:
+        path        -- the path
+        languages   -- if provided, restricts the values directories that are considered
+        filename    -- the name of the files read in values directories. Defaults to 'strings.xml'
+        usecomments -- if False the comments are ignored, defaults to True
+        jobs        -- the number of processes parsing the files, defaults to 1
+        cache       -- a ParseCache storing the parsed files, defaults to None"""
+        if os.path.isfile(path) and path.endswith('.xml'):
+            if languages:
+                language = languages[0]
+                if len(languages) > 1:
+                    logwarning('Too many languages specified for .xml file. Only considering first one i-e ' + language)
+            else:
+                language = self.android_language(os.path.basename(os.path.dirname(os.path.abspath(path))))
+                if not language:
+                    raise LangError("Language was not provided")
+            tables = [(path, language, usecomments, None)]
+        elif os.path.isdir(path) and self.android_language(os.path.basename(os.path.normpath(path))):
+            with profilephase('scan'):
+                tables = self.__android_valuestables([os.path.normpath(path)], filename, usecomments)
+        elif os.path.isdir(path):
+            with profilephase('scan'):
+                dirs = [os.path.join(path, p) for p in os.listdir(path) 
+                        if os.path.isdir(os.path.join(path, p)) and self.android_language(p) 
+                        and (not languages or self.android_language(p) in languages)]
+                if not dirs:
+                    raise LangError('Directory {} did not contain any values dir'.format(path))
+                tables = self.__android_valuestables(dirs, filename, usecomments)
+        else:
+            raise LangError('Invalid path: ' + path)
+        self.__feedtables(tables, 'android', None, jobs, cache)
+
+    @classmethod
+    def __android_valuestables(cls, dirs, filename, usecomments):
+        """Returns the tables to feed for values directories, see __cocoa_lprojtables.
+        Only the first table uses the comments."""
+        tables = []
+        for dirpath in dirs:
+            filepath = os.path.join(dirpath, filename)
+            if os.path.isfile(filepath):
+                tables.append((filepath, cls.android_language(os.path.basename(dirpath)), usecomments, None))
+                usecomments = False
+            else:
+                logwarning('File did not exist at path ' + filepath)
+        return tables
+
+    # size of the chunks fed to the xml parser
+    android_chunksize = 1 << 16
+
+    @classmethod
+    def android_parsestrings(cls, filepath):
+        """Parses an android resources file without storing anything.
+        The file is fed to the parser in chunks, see AndroidStringsTarget.
+        Returns the list of events found in the file, see cocoa_parsestrings.
+        Raises a LangError if the file is not valid xml.
+
+        Keyword arguments:
+        filepath -- the .xml file path"""
+        parser = ElementTree.XMLParser(target=AndroidStringsTarget())
+        (linecount, last) = (0, b'\n')
+        with open(filepath, 'rb') as f:
+            try:
+                for chunk in iter(lambda: f.read(cls.android_chunksize), b''):
+                    linecount += chunk.count(b'\n')
+                    last = chunk[-1:]
+                    parser.feed(chunk)
+                events = parser.close()
+            except SyntaxError as e:  # ParseError
+                raise LangError('Could not parse android file {}: {}'.format(filepath, e))
+        if last != b'\n':  # unterminated last line
+            linecount += 1
+        events.append(('lines', linecount))
+        return events
+
+    # Android writing
+
+    def android_writestrings(self, f, language):
+        """Writes the android strings of a language to a file object, one element at a time
+
+        Keyword Arguments:
+        f        -- the file object
+        language -- the language"""
+        if self.__pending:
+            self.loadlanguages([language])
+        f.write('<?xml version="1.0" encoding="utf-8"?>\n<resources>\n')
+        for element in self.__withbanners(self.elements.languageelements(language), language):
+            line = element.android_line(language)
+            if line:
+                f.write(line)
+                f.write('\n')
+        f.write('</resources>\n')
+
+    def android_write(self, languages=None, path='.', overwrite=False, filename='strings.xml', jobs=1, skipunchanged=False):
+        """Writes the resources in the corresponding values directories
+        e.g with the default arguments, the fr file will be written to values-fr/strings.xml
+        and the Base file to values/strings.xml.
+        Files are written atomically, see cocoa_write.
+        Returns the list of the paths that were skipped because they were unchanged.
+
+        Keyword Arguments:
+        languages     -- the chosen languages. If none is provided, all languages are created. Defaults to None.
+        path          -- the res directory in which the values directories will be written. Defaults to '.'
+        filename      -- the name of the files. Defaults to 'strings.xml'
+        jobs          -- the number of threads writing the languages concurrently. Defaults to 1
+        skipunchanged -- if True, existing files with the same content are not rewritten. Defaults to False
+        """
+        if os.path.exists(path) and not os.path.isdir(path):
+            raise LangError('Output path {} is not a directory'.format(path))
+
+        if not languages:
+            languages = self.languages
+        if self.__pending:
+            self.loadlanguages(languages)
+
+        outputs = []
+        for language in languages:
+            outputpath = os.path.join(path, self.android_directory(language), filename)
             if os.path.exists(outputpath) and not overwrite:
                 raise LangError('File already exists at path %s' % outputpath)
+            outputs.append((language, outputpath, None))
 
-            s = self.__cocoa_string(language, pretty)
-            loginfo('Writing cocoa file at path '+outputpath)
-            with  open(outputpath, 'w') as f:
-                f.write(s)
+        return self.__writefiles(outputs, 'android', lambda f, language, table: self.android_writestrings(f, language), jobs, skipunchanged)
 
     # Csv reading
 
     @classmethod
     def __csv_parsefirstrow(cls, row, languages, usecomments):
         """Returns (keyindex, commentindex, langindices)
+        The comment column is found even if the comments are not used, for the table banners.
         """
         (keyindex, commentindex, langindices) = (None, None, {})
         # Getting key
         try:
             keyindex = row.index('key')
-        except IndexError:
+        except ValueError:
             raise LangError('Could not find key column in csv')
         # Getting comment
-        if usecomments:
-            try:
-                commentindex = row.index('comment')
-            except IndexError:
+        try:
+            commentindex = row.index('comment')
+        except ValueError:
+            if usecomments:
                 logwarning('Could not find comment column in csv')
         # Getting languages
         for c in row:
@@ -622,93 +3298,270 @@ class LanguageResource:
 
         return (keyindex, commentindex, langindices)
 
-    def __csv_feedrow(self, row, keyindex, commentindex, langindices, index):
-        # Getting key
-        try:
-            key = row[keyindex]
-        except IndexError:
-            key = None
-        # Getting value
-        values = {}
-        for l in self.languages:
-            try:
-                values[l] = row[langindices[l]]
-            except KeyError, IndexError:  # Either language not present in file (language may come from another file), or column not present in row
-                values[l] = ''
-        # Getting comment
-        if commentindex == None:
-            comment = None
-        else:
-            try:
-                comment = row[commentindex]
-            except IndexError:
-                comment = None
+    # Csv writing
 
-        return self.__constructelements(key=key, languagevaluedic=values, comment=comment, index=index)
+    @classmethod
+    def csv_reader(cls, csvfile):
+        """Returns the csv reader used for the files of this script"""
+        return csv.reader(csvfile, delimiter=';', quotechar='"')
 
-    # Csv writing
+    @classmethod
+    def csv_parserows(cls, path):
+        """Returns the list of rows of a csv file"""
+        with opentext(path, newline='') as csvfile:
+            return list(cls.csv_reader(csvfile))
+
+    def csv_feed(self, path, languages=None, usecomments=True, cache=None):
+        """Creates all elements from a csv file
+
+        Keyword arguments:
+        path        -- the csv file path
+        languages   -- if provided, restricts the languages that are considered
+        usecomments -- if False the comments are ignored, defaults to True
+        cache       -- a ParseCache storing the parsed rows, defaults to None"""
+        self.__registersource(path, 'csv', None, usecomments, languages)
+        if profiler:
+            start = time.time()
+        rows = None
+        if cache:
+            rows = cache.get(path, 'csv', self.csv_parserows)
+        elif self.sources is not None:  # kept to be merged again, see refeed
+            rows = self.csv_parserows(path)
+        if rows is None:
+            with opentext(path, newline='') as csvfile:
+                self.__csv_feedrows(path, self.csv_reader(csvfile), languages, usecomments)
+        else:
+            if self.sources:
+                self.__recordevents(path, rows)
+            self.__csv_feedrows(path, rows, languages, usecomments)
+        if profiler:
+            duration = time.time() - start
+            profiler.addtime('csv_feed', duration)
+            profiler.addfile(path, 'csv_feed', bytes=os.path.getsize(path), seconds=duration)
+
+    def __csv_feedrows(self, path, rows, languages, usecomments):
+        """Stores the rows of a csv file, the first one being the header.
+        The columns are mapped to the languages once, and each row is then 
+        inserted with a single element lookup, whatever the number of languages.
+        Rows are consumed one at a time. The comments introducing a table 
+        (see LanguageElement.bannercomment) set the table of the following rows.
+
+        Keyword arguments:
+        path        -- the csv file path, for errors
+        rows        -- an iterable over the rows
+        languages   -- if provided, restricts the languages that are considered
+        usecomments -- if False the comments are ignored"""
+        rows = iter(rows)
+        header = next(rows, None)
+        if header is None:
+            return
+        (keyindex, commentindex, langindices) = self.__csv_parsefirstrow(header, languages, usecomments)
+
+        for l in langindices:
+            if l not in self.languages:
+                self.languages.append(l)
+
+        if not self.languages:
+            e = 'Did not find any language in file ' + path
+            if languages:
+                e += 'with language filter ' + str(languages)
+            raise LangError(e)
+
+        # the languages of the file, in the order of a dictionary of the languages, in which values used to be set
+        columns = [(l, langindices[l]) for l in dict.fromkeys(self.languages) if l in langindices]
+        # rows long enough to contain every column
+        indices = [keyindex] + list(langindices.values())
+        if commentindex is not None:
+            indices.append(commentindex)
+        width = max(indices) + 1
+
+        lastinsert = self.elements.last()
+        table = None
+        for row in rows:
+            if len(row) >= width:
+                key = row[keyindex]
+                if key:
+                    lastinsert = self.__insertrow(key, [(l, row[i]) for (l, i) in columns], lastinsert, path, table)
+                    continue
+                comment = None if commentindex is None else row[commentindex]
+            else:  # short row, the missing columns are empty
+                length = len(row)
+                key = row[keyindex] if keyindex < length else None
+                if key:
+                    values = [(l, row[i] if i < length else '') for (l, i) in columns]
+                    lastinsert = self.__insertrow(key, values, lastinsert, path, table)
+                    continue
+                comment = row[commentindex] if commentindex is not None and commentindex < length else None
+            banner = LanguageElement.bannertable(comment)
+            if banner:
+                table = banner
+            elif usecomments and comment:
+                lastinsert = self.__insertcomment(comment, lastinsert, table)
+            else:
+                lastinsert = self.elements.following(lastinsert)
+        self.__commit()
 
-    def csv_feed(self, path, languages=None, usecomments=True):
-        with open(path, 'rb') as csvfile:
-            reader = csv.reader(csvfile, delimiter=';', quotechar='"')
-            
-            (keyindex, commentindex, langindices) = (None, None, {})
-            lastinsertindex = len(self.elements)-1
-            for row in reader:
-                if keyindex == None:  # First row
-                    (keyindex, commentindex, langindices) = self.__csv_parsefirstrow(row, languages, usecomments)
-
-                    for l in langindices.keys():
-                        if l not in self.languages:
-                            self.languages.append(l)
-
-                    if not self.languages:
-                        e = 'Did not find any language in file ' + path
-                        if languages:
-                            e += 'with language filter ' + str(languages)
-                        raise LangError(e)
-                else:  # Any other row
-                    lastinsertindex = self.__csv_feedrow(row=row, keyindex=keyindex, commentindex=commentindex, langindices=langindices, index=lastinsertindex+1)
-
-    def csv_write(self, path='languages.csv', overwrite=False):
+    def csv_write(self, path='languages.csv', overwrite=False, skipunchanged=False):
         """Writes a csv file containing all the info
+        Returns the list of the paths that were skipped because they were unchanged.
+
+        Keyword Arguments:
+        path          -- the csv file path. Defaults to 'languages.csv'
+        overwrite     -- if False, raises a LangError if the file exists. Defaults to False
+        skipunchanged -- if True, an existing file with the same content is not rewritten. Defaults to False
         """
         if not overwrite:
             if os.path.exists(path):
                 raise LangError('File already existed at path "{}"'.format(path))
 
+        if self.__pending:
+            self.loadlanguages()
+
         loginfo('Writing csv file at path '+path)
 
-        with open(path, 'wb') as csvfile:
+        if profiler:
+            start = time.time()
+        with AtomicFile(path, 'w', self.write_buffersize, skipunchanged, 'utf-8') as csvfile:
             writer = csv.writer(csvfile, delimiter=';', quotechar='"', quoting=csv.QUOTE_ALL)
             writer.writerow(['comment','key', ] + self.languages)
-            for element in self.elements:
+            for element in self.__withbanners(self.elements):
                 writer.writerow(element.csv_columns(self.languages))
 
+        if profiler:
+            duration = time.time() - start
+            profiler.addtime('csv_write', duration)
+            profiler.addfile(path, 'csv_write', changed=csvfile.changed, bytes=os.path.getsize(path), seconds=duration)
+        if not csvfile.changed:
+            loginfo('Skipped unchanged file at path '+path)
+            return [path]
+        return []
+
+    # Snapshots
+
+    snapshot_magic = b'GDDLANG-SNAPSHOT'
+    # version of the snapshot payload, to be increased whenever it changes
+    snapshotversion = 2
+
+    def save_snapshot(self, path):
+        """Writes the languages, the elements and their values to a binary file,
+        which load_snapshot reads back much faster than the source files are fed.
+        The file is the magic string, the version byte, and the marshalled 
+        (languages, keys, comments, tables, columns, missing) payload, where keys, comments and tables
+        are the ones of every element in order ('' or None if none), and columns and missing
+        are per language the values of the keyed elements (None if missing) and 
+        the indices of the missing ones. The conflicts and sources are not saved.
+
+        Keyword Arguments:
+        path -- the snapshot file path"""
+        if self.__pending:
+            self.loadlanguages()
+        keys = []
+        comments = []
+        tables = []
+        rows = []
+        for element in self.elements:
+            keys.append(element.key)
+            comments.append(element.comment)
+            tables.append(element.table)
+            if element.key:
+                rows.append(element.row)
+        columns = []
+        missing = []
+        for language in self.languages:
+            values = self.columns.columnvalues(language, rows)
+            columns.append(values)
+            missing.append(set(i for (i, value) in enumerate(values) if value is None))
+        with AtomicFile(path, 'wb') as f:
+            f.write(self.snapshot_magic + bytes(bytearray([self.snapshotversion])))
+            f.write(marshal.dumps((list(self.languages), keys, comments, tables, columns, missing)))
+
+    def load_snapshot(self, path):
+        """Replaces the resources with the ones of a file written by save_snapshot.
+        The file is read at once and the elements are built in bulk.
+        Raises a LangError if the file is not a snapshot of the current version.
+
+        Keyword Arguments:
+        path -- the snapshot file path"""
+        with open(path, 'rb') as f:
+            data = f.read()
+        header = len(self.snapshot_magic)
+        if not data.startswith(self.snapshot_magic) or len(data) <= header:
+            raise LangError('Not a snapshot file: ' + path)
+        version = bytearray(data[header:header + 1])[0]
+        if version != self.snapshotversion:
+            raise LangError('Unsupported snapshot version {} in {}'.format(version, path))
+        # the objects created in bulk would trigger many useless collections
+        with nocollection():
+            try:
+                payload = marshal.loads(buffer(data, header + 1))
+            except (EOFError, ValueError, TypeError):
+                raise LangError('Corrupted snapshot file: ' + path)
+            # the text of Python 2 snapshots is bytes in Python 3, and the other way around
+            if any(not isinstance(language, str) for language in payload[0]):
+                raise LangError('Snapshot written by another major version of Python: ' + path)
+            self.__loadsnapshot(*payload)
+
+    def __loadsnapshot(self, languages, keys, comments, tables, columns, missing):
+        """Replaces the resources with the payload of a snapshot, see save_snapshot"""
+        self.reset()
+        elements = []
+        row = 0
+        for (key, comment, table) in izip(keys, comments, tables):
+            element = LanguageElement(key, None, self.columns, table)
+            if comment:
+                element.comment = comment
+            if key:
+                element.row = row
+                row += 1
+            elements.append(element)
+        # the rows are the indices of the keyed elements, unless the store allocates them
+        self.elements.extend(elements)
+        self.columns.loadcolumns(languages, [e.row for e in elements if e.key], 
+                                 [key for key in keys if key], columns, missing)
+        self.languages = languages
+        self.__commit()
+
     # Info
 
     def printinfo(self, details=False):
+        if self.__pending:
+            self.loadlanguages()
         print('\n==================\n'\
               ' Info\n')
         print('Languages: ' + str(self.languages))
-        print('String count: ' + str(len(self.keyedelements)))
+        print('String count: ' + str(self.elements.keyedcount()))
         # Calculating missing keys
         if self.languages and len(self.languages)>1:
-            missing = self.missingvalues()
+            missing = self.missingindex()
             if missing:
                 if details:
                     print('Missing values:')
-                    for k,v in missing.iteritems():
+                    for k,v in self.missingvalues().items():
                         print('   {} : {}'.format(k, v))
                 else:
                     print('Missing value count:')
-                    for k,v in missing.iteritems():
-                        print('   {} : {}'.format(k, len(v)))
+                    for k,v in missing.items():
+                        print('   {} : {}'.format(k, v))
             else:
                 print('No missing value')
 
         print('==================\n')
 
+# Workers
+
+def cocoa_parsestringsfile(filepath):
+    """Parses a .strings file in a worker process, see LanguageResource.cocoa_parsestrings"""
+    return LanguageResource.cocoa_parsestrings(filepath)
+
+def validateitems(args):
+    """Checks values in a worker process, see LanguageResource.validate"""
+    (items, reference) = args
+    return FormatValidator().validate(items, reference)
+
+def android_parsestringsfile(filepath):
+    """Parses an android file in a worker process, see LanguageResource.android_parsestrings"""
+    return LanguageResource.android_parsestrings(filepath)
+
 # Main
 
 if __name__ == '__main__':
@@ -716,7 +3569,7 @@ if __name__ == '__main__':
     __loginfo = True
 
     default_outdir = '~/Desktop'
-    default_outandroid = os.path.join(default_outdir, 'strings.xml')
+    default_outandroid = os.path.join(default_outdir, 'res')
     default_outios = os.path.join(default_outdir, 'strings')
     default_outcsv = os.path.join(default_outdir, 'languages.csv')
 
@@ -724,22 +3577,41 @@ if __name__ == '__main__':
     parser.add_argument('paths', help='Input paths.', type=str, nargs='+')
     parser.add_argument('--no_warning', help='Disable warnings', action='store_true', default=False)
     parser.add_argument('--no_comments', help='Disable comments', action='store_true', default=False)
-    parser.add_argument('--auto_correct', help='Consider conflicts? If not specified, you will be prompted if some happen', type=bool, choices=[True,False], default=None)
+    parser.add_argument('--auto_correct', help='Consider conflicts? If not specified, you will be prompted if some happen. See --conflict_policy', type=bool, choices=[True,False], default=None)
+    parser.add_argument('--conflict_policy', help='What to do with the values not terminated by a ;. Defaults to prompt if the input is a terminal, reject otherwise', choices=['prompt','accept','reject'])
+    parser.add_argument('--duplicate_policy', help='Which value to keep when a key has several values in a language. Defaults to first-wins', choices=LanguageResource.duplicatepolicies, default='first-wins')
+    parser.add_argument('--conflict_report', help='Write a JSON report of the conflicts and duplicates to the provided path, or to the standard output', nargs='?', type=str, const='-')
     parser.add_argument('-l', '--languages', help='Language filter', nargs='+', type=str)
+    parser.add_argument('-t', '--table', help='Table filter (e.g Localizable for Localizable.strings) of the cocoa files read and written. Defaults to all tables', type=str)
     parser.add_argument('--silent', help='Only outputs error', action='store_true', default=False)
+    parser.add_argument('--cache_dir', help='Directory caching the parsed input files. Defaults to no cache', type=str)
+    parser.add_argument('--cache_size', help='Maximum size of the cache in MB. Defaults to 256', type=int, default=256)
+    parser.add_argument('-j', '--jobs', help='Number of processes parsing cocoa and android files and of threads writing them. Defaults to 1', type=int, default=1)
+    parser.add_argument('--profile', help='Write a JSON report of the timings and counts of the run to the provided path, or to the standard output', nargs='?', type=str, const='-')
+    parser.add_argument('--watch', help='Keep running, feed again the input files that change and rewrite the affected outputs', action='store_true')
+    parser.add_argument('--database', help='Store the resources in a SQLite database at the provided path instead of the memory, for the resources that do not fit in memory. Its previous content is deleted', type=str)
+    parser.add_argument('--pool_values', help='Store identical values once in memory whatever their language or table, for the resources repeating many values (e.g left untranslated)', action='store_true')
+    parser.add_argument('--validate', help='Check that the format specifiers (e.g %%@ or %%1$d) and the escape sequences of the values match the ones of a reference language, en or the first language by default. Exits with status 1 if an argument differs', nargs='?', type=str, const='', metavar='REFERENCE')
+    parser.add_argument('--duplicate_values', help='Write a JSON report of the keys sharing an identical value in a language to the provided path, or to the standard output', nargs='?', type=str, const='-')
+    parser.add_argument('--lookup', help='Print the values of the provided keys as JSON, read from the cocoa input files through indexes of their keys, stored in the --cache_dir directory if provided, without feeding them', nargs='+', type=str)
+    parser.add_argument('--watch_interval', help='Seconds between two checks of the input files in watch mode. Defaults to 1', type=float, default=1.)
     # Input
     inputs = parser.add_argument_group(title='Input')
     inputargs = inputs.add_mutually_exclusive_group(required=True)
-    inputargs.add_argument('-a', help='Input is android.', action='store_true')
+    inputargs.add_argument('-a', help='Input is android. Path can either be a res folder containing values dirs, a values dir or a .xml file', action='store_true')
     inputargs.add_argument('-c', help='Input is csv. Expecting .csv file with first line : [comment] | keys | language1 | language2 ....', action='store_true')
     inputargs.add_argument('-i', help='Input is cocoa. Path can either be a folder containing lproj dirs, an lproj dir or a .strings file', action='store_true')
+    inputargs.add_argument('-s', help='Input is a snapshot written with --save_snapshot. Only the last path is considered', action='store_true')
     # Output
     outputs = parser.add_argument_group(title='Output')
     outputs.add_argument('--info', help='Do not print info. 0=No info 1=Default 2=Details.', default=1, type=int, choices=[0,1,2])
     outputs.add_argument('-A', help='Output android. If no path is provided, {} is used.'.format(default_outandroid), nargs='?', type=str, const=default_outandroid)
     outputs.add_argument('-C', help='Output csv. If no path is provided, {} is used'.format(default_outcsv), nargs='?', type=str, const=default_outcsv)
     outputs.add_argument('-I', help='Output cocoa. If no path is provided, {} is used'.format(default_outios), nargs='?', type=str, const=default_outios)
+    outputs.add_argument('--strings_encoding', help='Encoding of the cocoa files written, the ones read being decoded according to their byte order mark. Defaults to utf-8', choices=['utf-8', 'utf-16'], default='utf-8')
+    outputs.add_argument('--save_snapshot', help='Save the resources to a binary snapshot, much faster to read than the input files', type=str)
     outputs.add_argument('-f', '--force', help='Overwrite', action='store_true')
+    outputs.add_argument('--skip_unchanged', help='Do not rewrite the output files whose content did not change', action='store_true')
     outputs.add_argument('-p', '--pretty', help='Try to increase prettyness of output files', action='store_true')
 
     args = parser.parse_args()
@@ -754,39 +3626,173 @@ if __name__ == '__main__':
         __showinfo = True
         __showwarnings = True
 
-    res = LanguageResource()
-
-    for path in args.paths:
-        path=os.path.expanduser(path)
+    if args.profile:
+        setprofiler(Profiler())
 
-        if not os.path.exists(path):
-            print('Error: could not find file at path '+path)
+    cache = None
+    if args.cache_dir:
+        cache = ParseCache(os.path.expanduser(args.cache_dir), args.cache_size << 20)
 
-        if args.a:
-            print('Android input is not yet supported')
-            exit()
-        elif args.c:
-            res.csv_feed(path=path, languages=args.languages, usecomments=not args.no_comments)
-        elif args.i:
-            res.cocoa_feed(path=path, languages=args.languages, usecomments=not args.no_comments, autocorrect=args.auto_correct)
+    if args.lookup:
+        if not args.i:
+            parser.error('--lookup requires cocoa input files (-i)')
+        values = {}
+        for path in args.paths:
+            for (key, languages) in LanguageResource.cocoa_lookup(os.path.expanduser(path), args.lookup, args.languages, args.table, cache).items():
+                for (language, value) in languages.items():
+                    values.setdefault(key, {}).setdefault(language, value)
+        print(json.dumps(values, indent=2, sort_keys=True))
+        exit()
 
-    if args.info == 1:
-        res.printinfo(False)
-    elif args.info == 2:
-        res.printinfo(True)        
+    autocorrect = args.auto_correct
+    if args.conflict_policy:
+        autocorrect = { 'prompt' : None, 'accept' : True, 'reject' : False }[args.conflict_policy]
+    elif autocorrect == None and not sys.stdin.isatty():
+        autocorrect = False
+
+    if args.validate is not None and args.watch:
+        parser.error('--watch cannot be used with --validate')
+    if args.database and args.watch:
+        parser.error('--watch cannot be used with --database')
+    database = None
+    if args.database:
+        database = os.path.expanduser(args.database)
+    res = LanguageResource(duplicatepolicy=args.duplicate_policy, database=database, poolvalues=args.pool_values)
+    if database:
+        res.reset()
+    if args.watch:
+        res.tracksources()
+
+    with profilephase('feed'):
+        for path in args.paths:
+            path=os.path.expanduser(path)
+
+            if not os.path.exists(path):
+                print('Error: could not find file at path '+path)
+
+            if args.a:
+                res.android_feed(path=path, languages=args.languages, usecomments=not args.no_comments, jobs=args.jobs, cache=cache)
+            elif args.c:
+                res.csv_feed(path=path, languages=args.languages, usecomments=not args.no_comments, cache=cache)
+            elif args.i:
+                res.cocoa_feed(path=path, languages=args.languages, tablename=args.table, usecomments=not args.no_comments, autocorrect=autocorrect, jobs=args.jobs, cache=cache)
+            elif args.s:
+                res.load_snapshot(path)
+
+        if cache:
+            cache.save()
+
+    with profilephase('info'):
+        if args.info == 1:
+            res.printinfo(False)
+        elif args.info == 2:
+            res.printinfo(True)        
 
     if not res.getlanguages():
         exit()
 
-    if args.A:
-        print('Android output is not yet supported')
-    if args.C:
+    invalid = False
+    if args.validate is not None:
         try:
-            res.csv_write(path=os.path.expanduser(args.C), overwrite=args.force)
+            with profilephase('validate'):
+                issues = res.validate(args.validate or None)
         except LangError as e:
             print(e)
-    if args.I:
+            sys.exit(1)
+        for issue in issues:
+            if issue['severity'] == 'error':
+                invalid = True
+                print("ValidationError: key '{}' in {}: {}".format(issue['key'], issue['language'], issue['message']))
+            else:
+                logwarning("key '{}' in {}: {}".format(issue['key'], issue['language'], issue['message']))
+        loginfo('{} format issue(s)'.format(len(issues)))
+
+    def writeoutputs(languages=None, overwrite=args.force, skipunchanged=args.skip_unchanged, tables=None):
+        """Writes the requested outputs for the provided languages (all by default),
+        the cocoa ones for the provided tables (all or the --table one by default),
+        returns the list of the skipped paths"""
+        skipped = []
+        if args.A:
+            try:
+                skipped += res.android_write(languages=languages, path=os.path.expanduser(args.A), overwrite=overwrite, jobs=args.jobs, skipunchanged=skipunchanged)
+            except LangError as e:
+                print(e)
+        if args.C:
+            try:
+                skipped += res.csv_write(path=os.path.expanduser(args.C), overwrite=overwrite, skipunchanged=skipunchanged)
+            except LangError as e:
+                print(e)
+        if args.I:
+            for table in ([args.table] if tables is None else tables):
+                try:
+                    skipped += res.cocoa_write(languages=languages, path=os.path.expanduser(args.I), tablename=table, pretty=args.pretty, overwrite=overwrite, jobs=args.jobs, skipunchanged=skipunchanged, encoding=args.strings_encoding)
+                except LangError as e:
+                    print(e)
+        if args.save_snapshot:
+            loginfo('Writing snapshot at path ' + args.save_snapshot)
+            res.save_snapshot(os.path.expanduser(args.save_snapshot))
+        return skipped
+
+    with profilephase('write'):
+        skipped = writeoutputs()
+    if args.skip_unchanged:
+        loginfo('Skipped {} unchanged file(s)'.format(len(skipped)))
+
+    if res.conflicts:
+        loginfo('{} conflict(s) and {} duplicate(s)'.format(len(res.conflicts.conflicts), len(res.conflicts.duplicates)))
+    if args.conflict_report:
+        if args.conflict_report == '-':
+            res.conflicts.write(sys.stdout)
+        else:
+            with open(os.path.expanduser(args.conflict_report), 'w') as f:
+                res.conflicts.write(f)
+
+    if args.duplicate_values:
+        with profilephase('duplicates'):
+            duplicates = res.duplicatevalues(args.languages)
+        if args.duplicate_values == '-':
+            print(json.dumps(duplicates, indent=2, sort_keys=True))
+        else:
+            with open(os.path.expanduser(args.duplicate_values), 'w') as f:
+                json.dump(duplicates, f, indent=2, sort_keys=True)
+
+    if profiler:
+        if args.profile == '-':
+            profiler.write(sys.stdout)
+        else:
+            with open(os.path.expanduser(args.profile), 'w') as f:
+                profiler.write(f)
+
+    if invalid:
+        sys.exit(1)
+
+    if args.watch:
+        loginfo('Watching {} file(s), press Ctrl-C to stop'.format(len(res.sources)))
         try:
-            res.cocoa_write(path=os.path.expanduser(args.I), pretty=args.pretty, overwrite=args.force)
-        except LangError as e:
-            print(e)
+            while True:
+                time.sleep(args.watch_interval)
+                changed = res.changedsources()
+                if not changed:
+                    continue
+                start = time.time()
+                for path in changed:
+                    loginfo('Changed file at path ' + path)
+                try:
+                    changes = res.refeed(changed, autocorrect)
+                    languages = set(l for (l, _) in changes)
+                    tables = set(t for (_, t) in changes)
+                    if None in tables or args.table:  # every table, or the only one written
+                        tables = None
+                    else:
+                        tables = [t for t in res.gettables() if t in tables]
+                    # the outputs were written above, they are rewritten only if their content changed
+                    skipped = []
+                    if languages:
+                        skipped = writeoutputs([l for l in res.languages if l in languages], True, True, tables)
+                except (LangError, IOError, OSError, UnicodeError) as e:  # e.g a file being saved, fed again at the next check
+                    logerror(e)
+                    continue
+                loginfo('Rebuilt {} language(s) from {} changed file(s) in {:.3f}s, {} file(s) unchanged'.format(
+                        len(languages), len(changed), time.time() - start, len(skipped)))
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,275 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Benchmarks of gddlang on synthetic localization corpora.
+
+A corpus is a directory containing a .lproj tree and the equivalent
+;-delimited csv file. Every operation is timed in a fresh process so that
+the peak memory reported is the one of that operation (including feeding
+the resource for the write operations and missingvalues).
+
+The results are printed as JSON, and can be compared with a previous run:
+    python gddlang_bench.py -o new.json --compare old.json
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import csv
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import multiprocessing
+
+import gddlang
+
+# Corpus generation
+
+words = ('account', 'settings', 'cancel', 'done', 'the', 'your', 'new', 'message',
+         'photo', 'profile', 'share', 'with', 'friends', 'delete', 'this', 'item',
+         'could', 'not', 'be', 'loaded', 'please', 'try', 'again', 'later')
+
+def generatecorpus(path, keycount, languagecount=10, valuelength=30, commentdensity=0.3,
+                   multilinedensity=0.05, quotedensity=0.05, missingdensity=0.02, seed=0):
+    """Generates a corpus and returns its description
+
+    Keyword arguments:
+    path             -- the corpus directory, created if needed
+    keycount         -- the number of keys
+    languagecount    -- the number of languages. Defaults to 10
+    valuelength      -- the approximate length of a value. Defaults to 30
+    commentdensity   -- the probability that a key is preceded by a comment. Defaults to 0.3
+    multilinedensity -- the probability that a comment or a value spans several lines. Defaults to 0.05
+    quotedensity     -- the probability that a value contains escaped quotes. Defaults to 0.05
+    missingdensity   -- the probability that a value is missing in a language other than the first one. Defaults to 0.02
+    seed             -- the random seed. Defaults to 0"""
+    rnd = random.Random(seed)
+    languages = ['l{:02d}'.format(i) for i in range(languagecount)]
+
+    def text(length):
+        s = []
+        while sum(len(w) + 1 for w in s) < length:
+            s.append(rnd.choice(words))
+        return ' '.join(s)
+
+    # (key, comment, {language: [line]})
+    elements = []
+    for i in range(keycount):
+        comment = None
+        if rnd.random() < commentdensity:
+            if rnd.random() < multilinedensity:
+                comment = '{}\n{}'.format(text(40), text(40))
+            else:
+                comment = text(30)
+        values = {}
+        for language in languages:
+            if language != languages[0] and rnd.random() < missingdensity:
+                continue
+            # the lines of the value, continued on the next line of the .strings file
+            lines = [text(valuelength)]
+            if rnd.random() < multilinedensity:
+                lines = [lines[0] + '\\n', text(valuelength)]
+            if rnd.random() < quotedensity:
+                lines[0] = lines[0].replace(' ', ' \\"', 1)
+                lines[-1] += '\\"'
+            values[language] = lines
+        elements.append(('{} key {}'.format(rnd.choice(words), i), comment, values))
+
+    if not os.path.exists(path):
+        os.makedirs(path)
+    size = 0
+    for language in languages:
+        dirpath = os.path.join(path, 'lproj', language + os.path.extsep + 'lproj')
+        if not os.path.exists(dirpath):
+            os.makedirs(dirpath)
+        stringspath = os.path.join(dirpath, 'Localizable' + os.path.extsep + 'strings')
+        with open(stringspath, 'w') as f:
+            for (key, comment, values) in elements:
+                if comment and '\n' in comment:
+                    f.write('/*\n * ' + comment.replace('\n', '\n * ') + '\n */\n')
+                elif comment:
+                    f.write('// ' + comment + '\n')
+                if language in values:
+                    f.write('"{}" = "{}";\n'.format(key, '"\n"'.join(values[language])))
+        size += os.path.getsize(stringspath)
+
+    csvpath = os.path.join(path, 'languages' + os.path.extsep + 'csv')
+    with gddlang.AtomicFile(csvpath, 'w', encoding='utf-8') as csvfile:
+        writer = csv.writer(csvfile, delimiter=';', quotechar='"', quoting=csv.QUOTE_ALL)
+        writer.writerow(['comment', 'key'] + languages)
+        for (key, comment, values) in elements:
+            row = [comment or '', key]
+            row.extend(''.join(values.get(l, ())).replace('\\"', '"') for l in languages)
+            writer.writerow(row)
+
+    return { 'path' : path,
+             'keys' : keycount,
+             'languages' : languagecount,
+             'lproj_bytes' : size,
+             'csv_bytes' : os.path.getsize(csvpath) }
+
+# Measurements
+
+def peakmemory():
+    """Returns the peak resident memory of the process in MB"""
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':  # bytes instead of KB
+        peak //= 1024
+    return peak / 1024.
+
+def fedresource(corpus, kind):
+    """Returns a resource fed with the cocoa or csv files of a corpus"""
+    res = gddlang.LanguageResource()
+    if kind == 'cocoa':
+        res.cocoa_feed(os.path.join(corpus['path'], 'lproj'), autocorrect=True)
+    else:
+        res.csv_feed(os.path.join(corpus['path'], 'languages' + os.path.extsep + 'csv'))
+    return res
+
+def outputsize(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(d, f)) for (d, _, fs) in os.walk(path) for f in fs)
+
+def measure(operation, corpus, repeat):
+    """Times an operation, run in a worker process.
+    Returns (best duration, processed bytes, peak memory in MB)"""
+    gddlang.__showinfo = False
+    gddlang.__showwarnings = False
+    best = None
+    processed = None
+    outdir = tempfile.mkdtemp(prefix='gddlang_bench')
+    try:
+        res = None
+        if operation in ('cocoa_write', 'missingvalues'):
+            res = fedresource(corpus, 'cocoa')
+        elif operation == 'csv_write':
+            res = fedresource(corpus, 'csv')
+        elif operation == 'snapshot_load':
+            snapshotpath = os.path.join(outdir, 'snapshot.bin')
+            fedresource(corpus, 'cocoa').save_snapshot(snapshotpath)
+        for _ in range(repeat):
+            start = time.time()
+            if operation == 'cocoa_feed':
+                fedresource(corpus, 'cocoa')
+                processed = corpus['lproj_bytes']
+            elif operation == 'csv_feed':
+                fedresource(corpus, 'csv')
+                processed = corpus['csv_bytes']
+            elif operation == 'cocoa_write':
+                res.cocoa_write(path=outdir, overwrite=True)
+            elif operation == 'csv_write':
+                res.csv_write(path=os.path.join(outdir, 'out.csv'), overwrite=True)
+            elif operation == 'missingvalues':
+                res.missingvalues()
+            elif operation == 'snapshot_load':
+                gddlang.LanguageResource().load_snapshot(snapshotpath)
+                processed = os.path.getsize(snapshotpath)
+            duration = time.time() - start
+            if best is None or duration < best:
+                best = duration
+        if operation.endswith('_write'):
+            processed = outputsize(outdir)
+    finally:
+        shutil.rmtree(outdir)
+    return (best, processed, peakmemory())
+
+def measureworker(args):
+    return measure(*args)
+
+operations = ('cocoa_feed', 'csv_feed', 'cocoa_write', 'csv_write', 'missingvalues', 'snapshot_load')
+
+def runbenchmarks(sizes, repeat=3, operations=operations, workdir=None, **corpusargs):
+    """Generates a corpus of each size, times the operations and returns the results
+
+    Keyword arguments:
+    sizes      -- the key counts of the corpora
+    repeat     -- the number of times each operation is run, the best time is kept. Defaults to 3
+    operations -- the operations timed
+    workdir    -- the directory where the corpora are generated. Defaults to a temporary directory
+    corpusargs -- the other arguments of generatecorpus"""
+    results = []
+    tempdir = workdir or tempfile.mkdtemp(prefix='gddlang_corpus')
+    try:
+        for size in sizes:
+            corpus = generatecorpus(os.path.join(tempdir, str(size)), size, **corpusargs)
+            for operation in operations:
+                # a new process for each measurement, for a meaningful peak memory
+                pool = multiprocessing.Pool(1)
+                try:
+                    (duration, processed, peak) = pool.apply(measureworker, ((operation, corpus, repeat),))
+                finally:
+                    pool.terminate()
+                results.append({ 'operation' : operation,
+                                 'keys' : size,
+                                 'languages' : corpus['languages'],
+                                 'seconds' : duration,
+                                 'keys_per_second' : size / duration if duration else None,
+                                 'mb_per_second' : processed / duration / (1 << 20) if processed and duration else None,
+                                 'peak_memory_mb' : peak })
+                print('{:>14} {:>8} keys {:8.3f}s'.format(operation, size, duration), file=sys.stderr)
+    finally:
+        if not workdir:
+            shutil.rmtree(tempdir)
+    return results
+
+def compare(results, previous):
+    """Returns the lines comparing the durations of two runs"""
+    before = dict(((r['operation'], r['keys']), r) for r in previous['results'])
+    lines = []
+    for r in results['results']:
+        old = before.get((r['operation'], r['keys']))
+        if old:
+            lines.append('{:>14} {:>8} keys {:8.3f}s -> {:8.3f}s ({:+.1f}%)   {:.1f}MB -> {:.1f}MB'.format(
+                r['operation'], r['keys'], old['seconds'], r['seconds'],
+                (r['seconds'] / old['seconds'] - 1) * 100, old['peak_memory_mb'], r['peak_memory_mb']))
+    return lines
+
+# Main
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(prog='gddlang_bench', description='Benchmarks gddlang on synthetic corpora.')
+    parser.add_argument('-s', '--sizes', help='Key counts of the corpora. Defaults to 1000 10000 50000', nargs='+', type=int, default=[1000, 10000, 50000])
+    parser.add_argument('-l', '--languages', help='Number of languages. Defaults to 10', type=int, default=10)
+    parser.add_argument('-r', '--repeat', help='Number of runs of each operation, the best is kept. Defaults to 3', type=int, default=3)
+    parser.add_argument('--operations', help='Operations to time. Defaults to all', nargs='+', choices=operations, default=list(operations))
+    parser.add_argument('--value_length', help='Approximate length of the values. Defaults to 30', type=int, default=30)
+    parser.add_argument('--comment_density', help='Probability that a key has a comment. Defaults to 0.3', type=float, default=0.3)
+    parser.add_argument('--multiline_density', help='Probability that a comment or value is multiline. Defaults to 0.05', type=float, default=0.05)
+    parser.add_argument('--quote_density', help='Probability that a value contains escaped quotes. Defaults to 0.05', type=float, default=0.05)
+    parser.add_argument('--missing_density', help='Probability that a value is missing. Defaults to 0.02', type=float, default=0.02)
+    parser.add_argument('--seed', help='Random seed of the corpora. Defaults to 0', type=int, default=0)
+    parser.add_argument('--corpus_dir', help='Directory where the corpora are generated and kept. Defaults to a temporary directory', type=str)
+    parser.add_argument('-o', '--output', help='JSON output file. Defaults to the standard output', type=str)
+    parser.add_argument('--compare', help='JSON output of a previous run to compare with', type=str)
+
+    args = parser.parse_args()
+
+    results = runbenchmarks(args.sizes, args.repeat, args.operations, args.corpus_dir,
+                            languagecount=args.languages, valuelength=args.value_length,
+                            commentdensity=args.comment_density, multilinedensity=args.multiline_density,
+                            quotedensity=args.quote_density, missingdensity=args.missing_density, seed=args.seed)
+    results = { 'python' : platform.python_version(),
+                'platform' : platform.platform(),
+                'date' : time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'seed' : args.seed,
+                'results' : results }
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            for line in compare(results, json.load(f)):
+                print(line, file=sys.stderr)
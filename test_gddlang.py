@@ -0,0 +1,429 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Tests of gddlang, run with:
+    python -m unittest test_gddlang
+"""
+
+from __future__ import print_function
+
+import io
+import os
+import random
+import re
+import shutil
+import tempfile
+import unittest
+
+import gddlang
+
+gddlang.__showinfo = False
+gddlang.__showwarnings = False
+
+def writefile(path, content):
+    """Writes an ascii text file, creating its directory if needed"""
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'wb') as f:
+        f.write(content.encode('ascii'))
+
+def readtree(path):
+    """Returns the content of the files of a directory by relative path"""
+    files = {}
+    for (dirpath, _, filenames) in os.walk(path):
+        for filename in filenames:
+            filepath = os.path.join(dirpath, filename)
+            with open(filepath, 'rb') as f:
+                files[os.path.relpath(filepath, path)] = f.read()
+    return files
+
+def writeoutputs(res, path):
+    """Writes the cocoa, android and csv files of a resource to a directory and returns their content"""
+    res.cocoa_write(path=os.path.join(path, 'cocoa'), overwrite=True)
+    res.android_write(path=os.path.join(path, 'android'), overwrite=True)
+    res.csv_write(path=os.path.join(path, 'languages.csv'), overwrite=True)
+    return readtree(path)
+
+def readquoted(line, position):
+    """Reads the quoted string starting at position, see referencetokenizeline.
+    Returns (string, endposition), string being None if the string is not closed"""
+    quote = line[position]
+    start = position + 1
+    end = line.find(quote, start)
+    while end >= 0:
+        # counting the backslashes, an even number means that they escape each other
+        backslashes = 0
+        while end - backslashes > start and line[end - backslashes - 1] == '\\':
+            backslashes += 1
+        if not backslashes % 2:
+            return (line[start:end], end + 1)
+        end = line.find(quote, end + 1)
+    return (None, position)
+
+def referencetokenizeline(line):
+    """The tokenizer that cocoa_line_pattern replaced, jumping from quote to quote,
+    see LanguageResource.cocoa_tokenizeline"""
+    (key, value, semicolon, comment) = (None, None, False, None)
+    (spaces, length, position) = (' \t\n\r\f\v', len(line), 0)
+    if length and line[0] in '"\'':
+        (value, position) = readquoted(line, 0)
+        if value is None:
+            return None
+        while position < length and line[position] in spaces:
+            position += 1
+        if position < length and line[position] == '=':
+            key = value
+            position += 1
+            while position < length and line[position] in spaces:
+                position += 1
+            if position >= length or line[position] not in '"\'':
+                return None
+            (value, position) = readquoted(line, position)
+            if value is None:
+                return None
+            while position < length and line[position] in spaces:
+                position += 1
+    if position < length and line[position] == ';':
+        semicolon = True
+        position += 1
+    while position < length and line[position] in spaces + ';':
+        position += 1
+    if position < length:
+        if line[position] not in '/*|':
+            return None
+        comment = line[position:]
+    return (key, value, semicolon, comment)
+
+class ReferenceResource(gddlang.LanguageResource):
+    """A resource parsing .strings files with referencetokenizeline"""
+
+    @classmethod
+    def cocoa_tokenizeline(cls, line):
+        return referencetokenizeline(line)
+
+# a .strings file with escapes, comments and multiline values
+stringsfile = r"""/* Multiline
+ * comment
+ */
+"quote" = "Say \"hi\""; // escaped quotes
+"backslash" = "C:\\dir\\";
+"single" = 'It\'s';
+'mixed' = "a 'b' \"c\"" ;
+"multiline" = "first "
+              "second " // continued
+              "third";
+/** Pretty
+ ** comment */
+"empty" = "";
+"conflict" = "no semicolon"
+"after" = "value"; /* trailing */ 
+"spaces" = "v" ; ; // spaced semicolons
+"comment only" /* not a value */
+unparsable line
+"unterminated = "x;
+"slashes" = "http://example.com"; // comment with "quotes"
+"""
+
+class TokenizerTest(unittest.TestCase):
+    """cocoa_tokenizeline must split lines as the tokenizer it replaced did"""
+
+    lines = [
+        '"key" = "value";', "'key'='value'", '"key" = "value" // comment', '"key" = "value"; /* comment */',
+        '"a\\"b" = "c";', '"a\\\\" = "b\\\\\\"";', '"a\\\\\\" = "b";', '"value"', '"value";', '"v" ; ;',
+        '// comment', '/* comment', '*/', '| pipe', '', ';', '"key" =', '"key" = value;', '"key" "value";',
+        '"key"\t=\t"value"\t;\t// c', '"unterminated', '"key" = "value" x', '"key" = "value";; //', "'it\\'s'",
+    ]
+
+    def test_lines(self):
+        for line in self.lines:
+            self.assertEqual(gddlang.LanguageResource.cocoa_tokenizeline(line), referencetokenizeline(line), line)
+
+    def test_fuzz(self):
+        rnd = random.Random(0)
+        alphabet = ['"', "'", '\\', '=', ';', ' ', '\t', '/', '*', '|', 'a', 'b', '\\"', "\\'", '\\\\', '\n']
+        def quoted():
+            quote = rnd.choice('"\'')
+            characters = [rnd.choice(alphabet[4:] if rnd.random() < 0.8 else alphabet) for _ in range(rnd.randint(0, 8))]
+            return quote + ''.join(characters) + (quote if rnd.random() < 0.95 else '')
+        for _ in range(20000):
+            if rnd.random() < 0.3:
+                line = ''.join(rnd.choice(alphabet) for _ in range(rnd.randint(0, 12)))
+            else:
+                line = ''.join([quoted() + rnd.choice([' = ', '=', '\t=\t', ' ', '= x']) if rnd.random() < 0.7 else '',
+                                quoted(), rnd.choice(['', ';', ';;', ' ; ', 'x']),
+                                rnd.choice(['', ' // c', '// c "x"', ' /* c */', ' /* open', '/**/', ' //', '|x', ' y'])])
+            line = line.strip()
+            self.assertEqual(gddlang.LanguageResource.cocoa_tokenizeline(line), referencetokenizeline(line), line)
+
+    def test_events(self):
+        lines = stringsfile.splitlines()
+        self.assertEqual(gddlang.LanguageResource.cocoa_parselines(lines), ReferenceResource.cocoa_parselines(lines))
+
+class FeedPathsTest(unittest.TestCase):
+    """The lazy and database feeds, and the parse cache, must give the resource of a feed in memory"""
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp(prefix='gddlang_test')
+        writefile(os.path.join(self.path, 'cocoa', 'en.lproj', 'Localizable.strings'), stringsfile)
+        writefile(os.path.join(self.path, 'cocoa', 'fr.lproj', 'Localizable.strings'),
+                  '"quote" = "Dis \\"salut\\"";\n"multiline" = "premier "\n    "second";\n"new" = "nouveau"; // fr only\n')
+        writefile(os.path.join(self.path, 'cocoa', 'fr.lproj', 'InfoPlist.strings'), '/* Name */\n"CFBundleName" = "App";\n')
+        writefile(os.path.join(self.path, 'android', 'values-de', 'strings.xml'),
+                  '<?xml version="1.0" encoding="utf-8"?>\n<resources>\n    <!-- Quote -->\n'
+                  '    <string name="quote">Sag \\"hallo\\"</string>\n'
+                  '    <string name="multiline">erste\nzweite &amp; dritte</string>\n'
+                  '    <string name="single">It\\\'s</string>\n</resources>\n')
+        writefile(os.path.join(self.path, 'languages.csv'),
+                  'key;comment;en;es\n;Table : Localizable;;\nquote;;;"Di ""hola"""\n'
+                  'multiline;a comment;;"primera\nsegunda"\ncsv;;"one\ntwo";"uno"\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def feed(self, res, cache=None):
+        res.cocoa_feed(os.path.join(self.path, 'cocoa'), autocorrect=True, cache=cache)
+        res.android_feed(os.path.join(self.path, 'android'), cache=cache)
+        # the listed files are parsed in feeding order before the csv rows are inserted after them
+        res.loadlanguages()
+        res.csv_feed(os.path.join(self.path, 'languages.csv'), cache=cache)
+        return res
+
+    def outputs(self, res, name):
+        """Returns the files written for a resource and its conflict report"""
+        return (writeoutputs(res, os.path.join(self.path, name)), res.conflicts.report())
+
+    def test_paths(self):
+        expected = self.outputs(self.feed(gddlang.LanguageResource()), 'memory')
+        self.assertIn(b'"multiline" = "first second third";', expected[0][os.path.join('cocoa', 'en.lproj', 'Localizable.strings')])
+        self.assertEqual([c['key'] for c in expected[1]['conflicts']], ['conflict'])
+        self.assertEqual(self.outputs(self.feed(gddlang.LanguageResource(lazy=True)), 'lazy'), expected)
+        self.assertEqual(self.outputs(self.feed(gddlang.LanguageResource(poolvalues=True)), 'pooled'), expected)
+        database = os.path.join(self.path, 'resources.db')
+        self.assertEqual(self.outputs(self.feed(gddlang.LanguageResource(database=database)), 'database'), expected)
+        # stored, then read from the database, without the conflicts found while feeding
+        self.assertEqual(self.outputs(gddlang.LanguageResource(database=database), 'stored')[0], expected[0])
+        cache = gddlang.ParseCache(os.path.join(self.path, 'cache'))
+        for name in ('cached', 'fromcache'):
+            self.assertEqual(self.outputs(self.feed(gddlang.LanguageResource(), cache), name), expected)
+
+class WriterTest(unittest.TestCase):
+    """CocoaStringsWriter must write what the joined lines did, with the pretty substitution it replaced"""
+
+    class Line:
+        def __init__(self, line):
+            self.line = line
+
+        def cocoa_line(self, language):
+            return self.line
+
+    def test_fuzz(self):
+        rnd = random.Random(0)
+        fragments = ['"k" = "v";', '// c', '/* c */', '', ' ', '\t', '\n', ' \n ', '/', 'x /', '"a"\n"b"', '  // c']
+        for _ in range(5000):
+            lines = [''.join(rnd.choice(fragments) for _ in range(rnd.randint(0, 3))) for _ in range(rnd.randint(0, 6))]
+            for pretty in (False, True):
+                expected = '\n'.join(lines)
+                if pretty:
+                    expected = re.sub(r'$\s*?(?=/)', '\n\n', expected, flags=re.MULTILINE)
+                f = io.StringIO() if gddlang.PY3 else io.BytesIO()
+                writer = gddlang.CocoaStringsWriter(f, 'en', pretty)
+                for line in lines:
+                    writer.writeelement(self.Line(line))
+                writer.close()
+                self.assertEqual(f.getvalue(), expected, lines)
+
+    def test_banners(self):
+        path = tempfile.mkdtemp(prefix='gddlang_test')
+        try:
+            writefile(os.path.join(path, 'in', 'en.lproj', 'Localizable.strings'), '"hello" = "Hello";\n')
+            writefile(os.path.join(path, 'in', 'en.lproj', 'InfoPlist.strings'), '"CFBundleName" = "App";\n')
+            writefile(os.path.join(path, 'in', 'fr.lproj', 'Localizable.strings'), '"hello" = "Salut";\n')
+            res = gddlang.LanguageResource()
+            res.cocoa_feed(os.path.join(path, 'in'))
+            files = writeoutputs(res, os.path.join(path, 'out'))
+            # the tables without any fr value are not introduced in the files of all the tables
+            self.assertNotIn(b'InfoPlist', files[os.path.join('android', 'values-fr', 'strings.xml')])
+            self.assertIn(b'InfoPlist', files[os.path.join('android', 'values-en', 'strings.xml')])
+            self.assertIn(b'InfoPlist', files['languages.csv'])
+        finally:
+            shutil.rmtree(path)
+
+
+class LookupTest(unittest.TestCase):
+    """The values read through the indexes of the .strings files must be the parsed ones"""
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp(prefix='gddlang_test')
+        writefile(os.path.join(self.path, 'in', 'en.lproj', 'Localizable.strings'), stringsfile)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_lookup(self):
+        inputs = os.path.join(self.path, 'in')
+        cache = gddlang.ParseCache(os.path.join(self.path, 'cache'))
+        # the elements not terminated by a ; are not indexed
+        events = gddlang.LanguageResource.cocoa_parselines(stringsfile.splitlines())
+        expected = dict((e[1], {'en' : e[2]}) for e in events if e[0] == 'element' and e[1])
+        keys = list(expected) + ['conflict', 'missing']
+        expected.update(conflict={}, missing={})
+        for _ in range(2):  # built, then read from the cache
+            self.assertEqual(gddlang.LanguageResource.cocoa_lookup(inputs, keys, cache=cache), expected)
+        self.assertEqual(sorted(readtree(inputs)), [os.path.join('en.lproj', 'Localizable.strings')])
+        self.assertEqual(len([p for p in os.listdir(cache.path) if p.endswith('.idx')]), 1)
+        writefile(os.path.join(inputs, 'en.lproj', 'Localizable.strings'), '"quote" = "Changed";\n')
+        self.assertEqual(gddlang.LanguageResource.cocoa_lookup(inputs, ['quote', 'empty'], cache=cache),
+                         {'quote' : {'en' : 'Changed'}, 'empty' : {}})
+
+class RefeedTest(unittest.TestCase):
+    """A resource fed again with refeed once its files changed must be the one a fresh feed gives"""
+
+    # the .lproj directories, in feeding order
+    lprojs = ('fr', 'en')
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp(prefix='gddlang_test')
+        writefile(self.inputpath('en', 'Localizable'), '"hello" = "Hello";\n"quote" = "Quote";\n"bye" = "Bye";\n')
+        writefile(self.inputpath('fr', 'Localizable'), '"hello" = "Salut";\n"quote" = "Citation";\n')
+        writefile(self.inputpath('en', 'InfoPlist'), '// Name\n"CFBundleName" = "App";\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def inputpath(self, language, table):
+        return os.path.join(self.path, 'in', language + '.lproj', table + '.strings')
+
+    def feed(self, res):
+        for language in self.lprojs:
+            res.cocoa_feed(os.path.join(self.path, 'in', language + '.lproj'), autocorrect=True)
+        return res
+
+    def assertRefeedMatchesFeed(self, res, paths):
+        """Checks that refeeding paths gives the outputs of a fresh feed, and returns the changes"""
+        changes = res.refeed(paths, True)
+        self.assertEqual(writeoutputs(res, os.path.join(self.path, 'refed')),
+                         writeoutputs(self.feed(gddlang.LanguageResource()), os.path.join(self.path, 'fed')))
+        return changes
+
+    def tracked(self):
+        res = gddlang.LanguageResource()
+        res.tracksources()
+        return self.feed(res)
+
+    def test_addedkey(self):
+        res = self.tracked()
+        path = self.inputpath('fr', 'Localizable')
+        writefile(path, '"hello"="Salut";\n"quote"="Q";\n"extra"="X";\n')
+        self.assertEqual(res.changedsources(), [path])
+        changes = self.assertRefeedMatchesFeed(res, [path])
+        self.assertEqual(changes, set([('fr', 'Localizable'), ('en', 'Localizable')]))
+        self.assertEqual([e.key for e in res.elements if e.table == 'Localizable'], ['hello', 'quote', 'bye', 'extra'])
+
+    def test_changedvalue(self):
+        res = self.tracked()
+        path = self.inputpath('fr', 'Localizable')
+        writefile(path, '"hello" = "Bonjour";\n"quote" = "Citation";\n')
+        self.assertEqual(self.assertRefeedMatchesFeed(res, [path]), set([('fr', 'Localizable')]))
+
+    def test_deletedfile(self):
+        res = self.tracked()
+        path = self.inputpath('en', 'InfoPlist')
+        os.remove(path)
+        self.assertRefeedMatchesFeed(res, [path])
+        writefile(path, '"CFBundleName" = "Application";\n')
+        self.assertRefeedMatchesFeed(res, [path])
+
+    def test_invalidfiles(self):
+        res = self.tracked()
+        csvpath = os.path.join(self.path, 'in', 'languages.csv')
+        writefile(csvpath, 'key;comment;de\nhello;;Hallo\n')
+        res.csv_feed(csvpath)
+        xmlpath = os.path.join(self.path, 'in', 'values-es', 'strings.xml')
+        writefile(xmlpath, '<resources><string name="hello">Hola</string></resources>\n')
+        res.android_feed(xmlpath)
+        before = writeoutputs(res, os.path.join(self.path, 'before'))
+        # half-written files, the resource stays as it was until they are fed again
+        writefile(csvpath, 'comment;de\nhello;;Guten Tag\n')
+        writefile(xmlpath, '<resources><string name="hello">Buenos')
+        for path in (csvpath, xmlpath):
+            self.assertRaises(gddlang.LangError, res.refeed, [path], True)
+            self.assertEqual(writeoutputs(res, os.path.join(self.path, 'failed')), before)
+        self.assertEqual(sorted(res.changedsources()), sorted([csvpath, xmlpath]))
+        writefile(csvpath, 'key;comment;de\nhello;;Guten Tag\n')
+        writefile(xmlpath, '<resources><string name="hello">Buenos dias</string></resources>\n')
+        res.refeed(res.changedsources(), True)
+        self.assertEqual(res.changedsources(), [])
+        self.assertEqual((res.getvalue('hello', 'de'), res.getvalue('hello', 'es')), ('Guten Tag', 'Buenos dias'))
+
+    def test_filewithoutlanguage(self):
+        res = gddlang.LanguageResource()
+        res.tracksources()
+        path = os.path.join(self.path, 'in', 'languages.csv')
+        writefile(path, 'key;comment;de\nhello;;Hallo\n')
+        res.csv_feed(path)
+        writefile(path, 'key;comment\nhello;\n')
+        self.assertRaises(gddlang.LangError, res.refeed, [path])
+        self.assertEqual((res.languages, res.getvalue('hello', 'de'), res.changedsources()), (['de'], 'Hallo', [path]))
+
+    def test_conflicts(self):
+        writefile(self.inputpath('en', 'InfoPlist'), '"CFBundleName" = "App"\n"CFBundleDisplayName" = "App";\n')
+        res = gddlang.LanguageResource()
+        res.tracksources()
+        for language in self.lprojs:
+            res.cocoa_feed(os.path.join(self.path, 'in', language + '.lproj'), autocorrect=False)
+        path = self.inputpath('fr', 'Localizable')
+        writefile(path, '"hello" = "Bonjour";\n')
+        res.refeed([path], True)
+        # the rejected value of the file that did not change stays rejected
+        self.assertEqual([c['resolution'] for c in res.conflicts.conflicts], ['rejected'])
+        self.assertEqual(res.getvalue('CFBundleName', 'en'), None)
+
+class DuplicateTest(unittest.TestCase):
+    """Only the values given again for a key and a language are reported as duplicates"""
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp(prefix='gddlang_test')
+        writefile(os.path.join(self.path, 'a.csv'), 'key;comment;en;fr\nk1;;One;Un\n')
+        writefile(os.path.join(self.path, 'b.csv'), 'key;comment;en;de\nk1;;;Eins\nk2;;Two;Zwei\n')
+        # identical values built from different strings, not shared unless they are pooled
+        writefile(os.path.join(self.path, 'values.csv'), 'key;comment;en;fr\na;;OK;OK\nb;;Okay;OK\nc;;OK;Oui\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def feed(self, policy):
+        res = gddlang.LanguageResource(duplicatepolicy=policy)
+        for name in ('a.csv', 'b.csv'):
+            res.csv_feed(os.path.join(self.path, name))
+        return res
+
+    def test_emptyvalues(self):
+        for policy in ('first-wins', 'last-wins'):
+            res = self.feed(policy)
+            self.assertEqual(res.conflicts.duplicates, [])
+            self.assertEqual([res.getvalue('k1', l) for l in ('en', 'fr', 'de')], ['One', 'Un', 'Eins'])
+
+    def test_duplicates(self):
+        writefile(os.path.join(self.path, 'b.csv'), 'key;comment;en;de\nk1;;Uno;Eins\n')
+        for (policy, value) in (('first-wins', 'One'), ('last-wins', 'Uno')):
+            res = self.feed(policy)
+            self.assertEqual([(d['language'], d['kept'], d['discarded']) for d in res.conflicts.duplicates],
+                             [('en', value, 'Uno' if value == 'One' else 'One')])
+            self.assertEqual(res.getvalue('k1', 'en'), value)
+
+    def test_duplicatevalues(self):
+        expected = {'en' : {'OK' : ['a', 'c']}, 'fr' : {'OK' : ['a', 'b']}}
+        snapshot = os.path.join(self.path, 'snapshot')
+        for poolvalues in (False, True):
+            res = gddlang.LanguageResource(poolvalues=poolvalues)
+            res.csv_feed(os.path.join(self.path, 'values.csv'))
+            self.assertEqual(res.duplicatevalues(), expected)
+            if not poolvalues:
+                res.save_snapshot(snapshot)
+            # the values of a snapshot are not pooled
+            res = gddlang.LanguageResource(poolvalues=poolvalues)
+            res.load_snapshot(snapshot)
+            self.assertEqual(res.duplicatevalues(), expected)
+
+if __name__ == '__main__':
+    unittest.main()